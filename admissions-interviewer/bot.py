@@ -1,16 +1,34 @@
+import time
+
+_STARTUP_T0 = time.perf_counter()
+
+import io
 import os
+import re
+import sys
 import json
+import math
+import zlib
+import random
+import zipfile
+import socket
+import hashlib
+import asyncio
+import threading
 import sqlite3
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from xml.etree import ElementTree
 from urllib.parse import quote_plus
 
-import requests
-
 import discord
 from discord import app_commands
 from discord.ext import commands
-from openai import OpenAI
+
+# `openai` and `requests` are imported on first use (see get_client / brave_search).
 
 # ============================================================
 # Config
@@ -20,8 +38,18 @@ DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 GUILD_ID = int(os.getenv("GUILD_ID", "0"))  # optional but recommended
 DB_PATH = os.getenv("DB_PATH", "interviews.db")
 
+# Storage sharding. "none": everything lives in DB_PATH (default).
+# "guild": one SQLite file per guild; "hash": SHARD_COUNT files, guild id hashed.
+# When sharded, DB_PATH only holds the routing catalog and bot metadata.
+SHARD_MODE = os.getenv("SHARD_MODE", "none")
+SHARD_DIR = os.getenv("SHARD_DIR", "shards")
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "8"))
+SHARD_FANOUT_WORKERS = int(os.getenv("SHARD_FANOUT_WORKERS", "8"))
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # fast + cheap default
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")  # per-answer grading, FAQ answers, downgrades
+OPENAI_EVAL_MODEL = os.getenv("OPENAI_EVAL_MODEL", "gpt-4o")  # final evaluation
 BRAVE_API_KEY = os.getenv("BRAVE_API_KEY", "")  # optional web search for candidate questions
 
 # Profile paths (switchable at runtime)
@@ -43,7 +71,93 @@ PROFILE_MAP = {
 
 DEFAULT_PROFILE = os.getenv("INTERVIEW_PROFILE", "admissions")
 
+# Slash commands are only re-synced when the command tree hash changes
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "0") == "1"
+
+# Per-stage model routing: "*" applies to every profile, a profile key overrides it.
+# MODEL_ROUTING_JSON (same shape) is merged on top, e.g.
+#   {"ai-tech-zh": {"question": {"model": "gpt-4o", "latency_budget_s": 8}}}
+MODEL_ROUTING = {
+    "*": {
+        "faq": {"model": OPENAI_FAST_MODEL, "temperature": 0.2, "max_output_tokens": 300, "latency_budget_s": 4.0, "fallback_model": OPENAI_FAST_MODEL},
+        "grade": {"model": OPENAI_FAST_MODEL, "temperature": 0.1, "max_output_tokens": 200, "latency_budget_s": 4.0, "fallback_model": OPENAI_FAST_MODEL},
+        "question": {"model": OPENAI_MODEL, "temperature": 0.2, "max_output_tokens": 600, "latency_budget_s": 8.0, "fallback_model": OPENAI_FAST_MODEL},
+        "evaluate": {"model": OPENAI_EVAL_MODEL, "temperature": 0.2, "max_output_tokens": 4000, "latency_budget_s": 60.0, "fallback_model": OPENAI_MODEL},
+    },
+}
+ROUTING_WINDOW = int(os.getenv("ROUTING_WINDOW", "50"))  # recent calls kept per stage/model
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "10"))  # before p95 is trusted
+ROUTING_DOWNGRADE_SECONDS = float(os.getenv("ROUTING_DOWNGRADE_SECONDS", "600"))  # then retry the primary
+ROUTING_TIMEOUT_FACTOR = float(os.getenv("ROUTING_TIMEOUT_FACTOR", "2"))  # request timeout = latency budget x this
+
+# Token accounting: USD per 1M tokens as (input, cached input, output). Dated
+# snapshots ("gpt-4o-2024-08-06") use their base entry; unknown models are
+# billed at the most expensive entry. MODEL_PRICING_JSON merges on top.
+MODEL_PRICING = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+}
+if os.getenv("MODEL_PRICING_JSON"):
+    MODEL_PRICING.update({k: tuple(v) for k, v in json.loads(os.getenv("MODEL_PRICING_JSON")).items()})
+
+# Budgets in USD; 0 = unlimited. Over budget every stage runs on BUDGET_CHEAP_MODEL;
+# over budget * BUDGET_HARD_FACTOR questions come from the question bank without an LLM.
+SESSION_BUDGET_USD = float(os.getenv("SESSION_BUDGET_USD", "0"))
+GUILD_DAILY_BUDGET_USD = float(os.getenv("GUILD_DAILY_BUDGET_USD", "0"))  # per UTC day
+BUDGET_CHEAP_MODEL = os.getenv("BUDGET_CHEAP_MODEL", OPENAI_FAST_MODEL)
+BUDGET_HARD_FACTOR = float(os.getenv("BUDGET_HARD_FACTOR", "1.5"))
+
+# Stateful next-question calls: one stored Responses API conversation per session
+# (previous_response_id), so each turn only sends the new question and answer.
+# The chain is rebuilt from the full prompt after RESPONSE_CHAIN_TTL_SECONDS
+# (stored responses expire), on a profile switch, a new resume, or an API error.
+STATEFUL_QUESTIONS = os.getenv("STATEFUL_QUESTIONS", "0") == "1"
+RESPONSE_CHAIN_TTL_SECONDS = float(os.getenv("RESPONSE_CHAIN_TTL_SECONDS", "86400"))
+
+# Cross-session FAQ answer cache, per profile and guild (see faq_cache_lookup).
+# Questions are matched by cosine similarity of char n-gram TF-IDF vectors.
+FAQ_CACHE_ENABLED = os.getenv("FAQ_CACHE_ENABLED", "1") == "1"
+FAQ_CACHE_THRESHOLD = float(os.getenv("FAQ_CACHE_THRESHOLD", "0.75"))
+FAQ_CACHE_TTL_SECONDS = float(os.getenv("FAQ_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))  # pinned answers never expire
+FAQ_INDEX_REFRESH_SECONDS = float(os.getenv("FAQ_INDEX_REFRESH_SECONDS", "30"))  # other processes' new entries
+
+# Durable job queue (grading / question generation / evaluation)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # in-process workers; 0 = delivery only
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))  # renewed every third of this while a job runs
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+JOB_IDLE_SHARD_MAX_SECONDS = float(os.getenv("JOB_IDLE_SHARD_MAX_SECONDS", "5"))  # sharded: longest skip of an idle shard
+
+# Outbound Discord messages (per-channel queues)
+DISCORD_MESSAGE_LIMIT = 1900  # hard limit is 2000; leave room for fence reopen/close
+OUTBOX_COALESCE_SECONDS = float(os.getenv("OUTBOX_COALESCE_SECONDS", "0.15"))  # merge replies that arrive together
+CHANNEL_RATE_LIMIT = (5, 5.0)  # messages per seconds, per channel
+GLOBAL_RATE_LIMIT = (45, 1.0)  # requests per seconds, whole bot (Discord allows 50)
+
+# Resume ingestion / retrieval
+RESUME_MAX_BYTES = int(os.getenv("RESUME_MAX_BYTES", str(5 * 1024 * 1024)))
+RESUME_PARSE_WORKERS = int(os.getenv("RESUME_PARSE_WORKERS", "2"))
+RESUME_PARSE_TIMEOUT_SECONDS = float(os.getenv("RESUME_PARSE_TIMEOUT_SECONDS", "30"))
+RESUME_MAX_XML_BYTES = int(os.getenv("RESUME_MAX_XML_BYTES", str(20 * 1024 * 1024)))  # DOCX text after unzipping
+RESUME_CHUNK_CHARS = int(os.getenv("RESUME_CHUNK_CHARS", "700"))
+RESUME_TOP_K = int(os.getenv("RESUME_TOP_K", "4"))
+
 MAX_TURNS = 20
+
+# Early termination from graded answers (see evidence_coverage). Per category,
+# confidence = evidence / (evidence + EVIDENCE_PRIOR_WEIGHT); the interview stops
+# once every category reaches EVIDENCE_CONFIDENCE_THRESHOLD, or once every category
+# is above EVIDENCE_STABLE_MIN_CONFIDENCE, got new evidence in the last
+# EVIDENCE_STABLE_TURNS answers and its estimate moved less than EVIDENCE_STABLE_DELTA.
+EVIDENCE_CONFIDENCE_THRESHOLD = float(os.getenv("EVIDENCE_CONFIDENCE_THRESHOLD", "0.7"))
+EVIDENCE_STABLE_MIN_CONFIDENCE = float(os.getenv("EVIDENCE_STABLE_MIN_CONFIDENCE", str(EVIDENCE_CONFIDENCE_THRESHOLD / 2)))
+EVIDENCE_PRIOR_WEIGHT = float(os.getenv("EVIDENCE_PRIOR_WEIGHT", "1.0"))
+EVIDENCE_STABLE_TURNS = int(os.getenv("EVIDENCE_STABLE_TURNS", "3"))
+EVIDENCE_STABLE_DELTA = float(os.getenv("EVIDENCE_STABLE_DELTA", "0.25"))  # on the 1-5 quality scale
+EVIDENCE_MIN_TURNS = int(os.getenv("EVIDENCE_MIN_TURNS", "6"))
 TARGET_CATEGORIES = [
     "communication_clarity",
     "motivation_purpose",
@@ -66,6 +180,20 @@ def get_opening_question() -> str:
 # Utilities
 # ============================================================
 
+STARTUP_TIMINGS = []  # (label, seconds since previous mark)
+_LAST_STARTUP_MARK = _STARTUP_T0
+
+def mark_startup(label: str):
+    global _LAST_STARTUP_MARK
+    now = time.perf_counter()
+    STARTUP_TIMINGS.append((label, now - _LAST_STARTUP_MARK))
+    _LAST_STARTUP_MARK = now
+
+def startup_report() -> str:
+    lines = [f"  {label:<24} {secs * 1000:8.1f} ms" for label, secs in STARTUP_TIMINGS]
+    lines.append(f"  {'total (process start)':<24} {(time.perf_counter() - _STARTUP_T0) * 1000:8.1f} ms")
+    return "Startup timing:\n" + "\n".join(lines)
+
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
@@ -76,12 +204,12 @@ def read_file_safe(path: str, fallback: str = "") -> str:
     except Exception:
         return fallback
 
-def db():
-    return sqlite3.connect(DB_PATH)
+def db(path: Optional[str] = None):
+    # timeout = busy wait; bot and worker processes share the same files
+    return sqlite3.connect(path or DB_PATH, timeout=30)
 
-def init_db():
-    conn = db()
-    cur = conn.cursor()
+def init_shard_schema(cur):
+    cur.execute("PRAGMA journal_mode=WAL")
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS sessions (
@@ -91,9 +219,13 @@ def init_db():
         status TEXT NOT NULL, -- active|ended
         question_index INTEGER NOT NULL DEFAULT 0,
         started_at TEXT NOT NULL,
-        ended_at TEXT
+        ended_at TEXT,
+        guild_id TEXT
     )
     """)
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(sessions)").fetchall()}
+    if "guild_id" not in cols:
+        cur.execute("ALTER TABLE sessions ADD COLUMN guild_id TEXT")
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS messages (
@@ -139,17 +271,432 @@ def init_db():
         correctness TEXT,
         reasoning TEXT,
         created_at TEXT NOT NULL,
+        categories_json TEXT, -- rubric category keys the answer is evidence for
         FOREIGN KEY(session_id) REFERENCES sessions(id),
         FOREIGN KEY(message_id) REFERENCES messages(id)
     )
     """)
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(answer_assessments)").fetchall()}
+    if "categories_json" not in cols:
+        cur.execute("ALTER TABLE answer_assessments ADD COLUMN categories_json TEXT")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL, -- faq|grade|question|evaluate
+        session_id INTEGER NOT NULL,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        payload_json TEXT NOT NULL DEFAULT '{}',
+        status TEXT NOT NULL DEFAULT 'pending', -- pending|leased|done|failed
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires_at REAL,
+        last_error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        FOREIGN KEY(session_id) REFERENCES sessions(id)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, available_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs(session_id, status)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL,
+        channel_id TEXT NOT NULL,
+        content TEXT NOT NULL,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        parts_sent INTEGER NOT NULL DEFAULT 0, -- split parts already delivered
+        created_at TEXT NOT NULL,
+        sent_at TEXT, -- NULL until delivered
+        failed_at TEXT, -- set once OUTBOX_MAX_ATTEMPTS is reached; never retried
+        FOREIGN KEY(session_id) REFERENCES sessions(id)
+    )
+    """)
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(outbox)").fetchall()}
+    if "parts_sent" not in cols:
+        cur.execute("ALTER TABLE outbox ADD COLUMN parts_sent INTEGER NOT NULL DEFAULT 0")
+    if "failed_at" not in cols:
+        cur.execute("ALTER TABLE outbox ADD COLUMN failed_at TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_unsent ON outbox(sent_at, id)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS resume_chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL,
+        chunk_index INTEGER NOT NULL,
+        section TEXT NOT NULL,
+        content TEXT NOT NULL,
+        term_freq_json TEXT NOT NULL, -- {token: count}, BM25 index
+        length INTEGER NOT NULL,      -- token count
+        FOREIGN KEY(session_id) REFERENCES sessions(id)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_resume_chunks_session ON resume_chunks(session_id, chunk_index)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS llm_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL,
+        guild_id TEXT,
+        stage TEXT NOT NULL, -- faq|grade|question|evaluate
+        model TEXT NOT NULL,
+        input_tokens INTEGER NOT NULL DEFAULT 0, -- includes cached_tokens
+        cached_tokens INTEGER NOT NULL DEFAULT 0,
+        output_tokens INTEGER NOT NULL DEFAULT 0,
+        cost_usd REAL NOT NULL DEFAULT 0,
+        latency_ms INTEGER,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY(session_id) REFERENCES sessions(id)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_session ON llm_usage(session_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_guild ON llm_usage(guild_id, created_at)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS faq_cache (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        profile TEXT NOT NULL,
+        guild_id TEXT NOT NULL,
+        question TEXT NOT NULL,
+        norm_question TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        pinned INTEGER NOT NULL DEFAULT 0, -- set by admins; never expires
+        hits INTEGER NOT NULL DEFAULT 0,
+        expires_at REAL, -- unix time; NULL when pinned
+        created_at TEXT NOT NULL,
+        UNIQUE(profile, guild_id, norm_question)
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS llm_conversations (
+        session_id INTEGER PRIMARY KEY,
+        response_id TEXT NOT NULL, -- latest response; next call chains from it
+        profile TEXT NOT NULL,
+        started_at REAL NOT NULL, -- unix time the chain was built from a full prompt
+        updated_at REAL NOT NULL,
+        FOREIGN KEY(session_id) REFERENCES sessions(id)
+    )
+    """)
+
+def init_db():
+    SESSION_SHARDS.clear()
+    CHANNEL_SHARDS.clear()
+    INITIALIZED_SHARDS.clear()
+    SHARD_LIST_CACHE.clear()
+
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    if not SHARDED:
+        init_shard_schema(cur)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS bot_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TEXT NOT NULL
+    )
+    """)
+
+    # Routing catalog (only used when SHARD_MODE is guild|hash)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS session_routes (
+        session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        shard_path TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_session_routes_channel ON session_routes(channel_id, session_id)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS shards (
+        name TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """)
 
     conn.commit()
     conn.close()
 
-def get_active_session(channel_id: int):
+    if SHARDED:
+        for path in all_shard_paths():
+            ensure_shard_schema(path)
+
+# ============================================================
+# Storage routing (shards)
+# ============================================================
+# Sessions are routed to a shard file by guild. Session ids come from the
+# catalog so they stay unique across shards; channel and session routes never
+# change, so they are cached per process. With SHARD_MODE=none every helper
+# below resolves to DB_PATH.
+
+SHARDED = SHARD_MODE in ("guild", "hash")
+SESSION_SHARDS = {}  # session_id -> shard path
+CHANNEL_SHARDS = {}  # channel_id -> shard path
+INITIALIZED_SHARDS = set()
+SHARD_LIST_CACHE = {}  # "paths" -> (expires_at, [paths])
+SHARD_POOL = ThreadPoolExecutor(max_workers=max(1, SHARD_FANOUT_WORKERS), thread_name_prefix="shard")
+
+def shard_name_for_guild(guild_id) -> str:
+    gid = str(guild_id or 0)
+    if SHARD_MODE == "guild":
+        return f"guild_{gid}"
+    return f"part_{zlib.crc32(gid.encode('utf-8')) % SHARD_COUNT:03d}"
+
+def ensure_shard_schema(path: str):
+    if path in INITIALIZED_SHARDS:
+        return
+    conn = db(path)
+    init_shard_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+    INITIALIZED_SHARDS.add(path)
+
+def ensure_shard(name: str) -> str:
+    path = os.path.join(SHARD_DIR, f"{name}.db")
+    if path not in INITIALIZED_SHARDS:
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        ensure_shard_schema(path)
+        conn = db()
+        cur = conn.cursor()
+        cur.execute("INSERT OR IGNORE INTO shards(name, path, created_at) VALUES (?, ?, ?)", (name, path, now_iso()))
+        conn.commit()
+        conn.close()
+        SHARD_LIST_CACHE.clear()
+    return path
+
+def shard_for_guild(guild_id) -> str:
+    return ensure_shard(shard_name_for_guild(guild_id)) if SHARDED else DB_PATH
+
+def existing_shard_for_guild(guild_id) -> Optional[str]:
+    # For read paths: None (instead of a new empty shard) when the guild has none yet.
+    if not SHARDED:
+        return DB_PATH
+    path = os.path.join(SHARD_DIR, f"{shard_name_for_guild(guild_id)}.db")
+    return path if path in INITIALIZED_SHARDS or path in all_shard_paths() else None
+
+def all_shard_paths() -> List[str]:
+    if not SHARDED:
+        return [DB_PATH]
+    cached = SHARD_LIST_CACHE.get("paths")
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT path FROM shards ORDER BY name ASC")
+    paths = [r[0] for r in cur.fetchall()]
+    conn.close()
+    SHARD_LIST_CACHE["paths"] = (time.monotonic() + 5.0, paths)
+    return paths
+
+def shard_for_session(session_id: int) -> str:
+    if not SHARDED:
+        return DB_PATH
+    path = SESSION_SHARDS.get(session_id)
+    if path is None:
+        conn = db()
+        cur = conn.cursor()
+        cur.execute("SELECT shard_path FROM session_routes WHERE session_id=?", (session_id,))
+        row = cur.fetchone()
+        conn.close()
+        if not row:
+            raise KeyError(f"No shard route for session #{session_id}")
+        path = SESSION_SHARDS[session_id] = row[0]
+    return path
+
+def shard_for_channel(channel_id: int) -> Optional[str]:
+    if not SHARDED:
+        return DB_PATH
+    key = str(channel_id)
+    path = CHANNEL_SHARDS.get(key)
+    if path is None:
+        conn = db()
+        cur = conn.cursor()
+        cur.execute("""
+          SELECT shard_path FROM session_routes
+          WHERE channel_id=?
+          ORDER BY session_id DESC
+          LIMIT 1
+        """, (key,))
+        row = cur.fetchone()
+        conn.close()
+        if not row:
+            return None  # no interview ever ran here; not cached so a new one is found
+        path = CHANNEL_SHARDS[key] = row[0]
+    return path
+
+def session_db(session_id: int):
+    return db(shard_for_session(session_id))
+
+def create_session(candidate_id: str, channel_id: int, guild_id: Optional[int]) -> int:
+    if not SHARDED:
+        conn = db()
+        cur = conn.cursor()
+        cur.execute("""
+          INSERT INTO sessions(candidate_id, channel_id, status, question_index, started_at, guild_id)
+          VALUES (?, ?, 'active', 0, ?, ?)
+        """, (candidate_id, str(channel_id), now_iso(), str(guild_id or 0)))
+        session_id = cur.lastrowid
+        conn.commit()
+        conn.close()
+        return session_id
+
+    path = ensure_shard(shard_name_for_guild(guild_id))
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("""
+      INSERT INTO session_routes(guild_id, channel_id, shard_path, created_at)
+      VALUES (?, ?, ?, ?)
+    """, (str(guild_id or 0), str(channel_id), path, now_iso()))
+    session_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+    SESSION_SHARDS[session_id] = path
+    CHANNEL_SHARDS[str(channel_id)] = path
+
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("""
+      INSERT INTO sessions(id, candidate_id, channel_id, status, question_index, started_at, guild_id)
+      VALUES (?, ?, ?, 'active', 0, ?, ?)
+    """, (session_id, candidate_id, str(channel_id), now_iso(), str(guild_id or 0)))
+    conn.commit()
+    conn.close()
+    return session_id
+
+def fan_out(fn, paths: Optional[List[str]] = None) -> List[Any]:
+    # Run fn(shard_path) on every shard in parallel; results in shard order.
+    return list(SHARD_POOL.map(fn, paths if paths is not None else all_shard_paths()))
+
+# --------------------------
+# Cross-shard operations (operator CLI: export / search / stats)
+# --------------------------
+
+def _export_shard(path: str) -> List[Dict[str, Any]]:
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("SELECT id, candidate_id, channel_id, status, started_at, ended_at FROM sessions ORDER BY id ASC")
+    sessions = {
+        r[0]: {
+            "session_id": r[0], "candidate_id": r[1], "channel_id": r[2], "status": r[3],
+            "started_at": r[4], "ended_at": r[5], "shard": path, "messages": [], "evaluations": [],
+        }
+        for r in cur.fetchall()
+    }
+    cur.execute("SELECT session_id, role, author_id, content, created_at FROM messages ORDER BY id ASC")
+    for sid, role, author_id, content, created_at in cur.fetchall():
+        if sid in sessions:
+            sessions[sid]["messages"].append({"role": role, "author_id": author_id, "content": content, "created_at": created_at})
+    cur.execute("SELECT session_id, result_json, created_at FROM evaluations ORDER BY id ASC")
+    for sid, result_json, created_at in cur.fetchall():
+        if sid in sessions:
+            sessions[sid]["evaluations"].append({"result": json.loads(result_json or "null"), "created_at": created_at})
+    conn.close()
+    return list(sessions.values())
+
+def export_all_sessions(out_path: str) -> int:
+    sessions = [sess for shard in fan_out(_export_shard) for sess in shard]
+    sessions.sort(key=lambda x: x["session_id"])
+    with open(out_path, "w", encoding="utf-8") as f:
+        for sess in sessions:
+            f.write(json.dumps(sess, ensure_ascii=False) + "\n")
+    return len(sessions)
+
+def search_transcripts(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    def _search(path: str):
+        conn = db(path)
+        cur = conn.cursor()
+        cur.execute("""
+          SELECT m.session_id, s.candidate_id, m.role, m.content, m.created_at
+          FROM messages AS m JOIN sessions AS s ON s.id = m.session_id
+          WHERE instr(lower(m.content), lower(?)) > 0
+          ORDER BY m.id DESC
+          LIMIT ?
+        """, (query, limit))
+        rows = cur.fetchall()
+        conn.close()
+        return [{"session_id": r[0], "candidate_id": r[1], "role": r[2], "content": r[3], "created_at": r[4]} for r in rows]
+
+    hits = [h for shard in fan_out(_search) for h in shard]
+    hits.sort(key=lambda h: h["created_at"], reverse=True)
+    return hits[:limit]
+
+def _stats_shard(path: str) -> Dict[str, Any]:
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("SELECT status, COUNT(*) FROM sessions GROUP BY status")
+    by_status = dict(cur.fetchall())
+    cur.execute("SELECT COUNT(*) FROM messages")
+    messages = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(quality_score), 0) FROM answer_assessments")
+    graded, quality_sum = cur.fetchone()
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0), COALESCE(SUM(cost_usd), 0) FROM llm_usage")
+    llm_calls, input_tokens, output_tokens, cost_usd = cur.fetchone()
+    cur.execute("SELECT COUNT(*) FROM outbox WHERE failed_at IS NOT NULL")
+    undelivered = cur.fetchone()[0]
+    cur.execute("SELECT result_json FROM evaluations")
+    recommendations = {}
+    for (result_json,) in cur.fetchall():
+        try:
+            rec = (json.loads(result_json or "{}") or {}).get("recommendation", "N/A")
+        except Exception:
+            rec = "N/A"
+        recommendations[rec] = recommendations.get(rec, 0) + 1
+    conn.close()
+    return {
+        "by_status": by_status, "messages": messages, "graded": graded, "quality_sum": quality_sum, "recommendations": recommendations,
+        "llm_calls": llm_calls, "input_tokens": input_tokens, "output_tokens": output_tokens, "cost_usd": cost_usd,
+        "undelivered_replies": undelivered,
+    }
+
+def interview_stats() -> Dict[str, Any]:
+    shards = fan_out(_stats_shard)
+    total = {
+        "shards": len(shards), "by_status": {}, "messages": 0, "graded": 0, "quality_sum": 0, "recommendations": {},
+        "llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "undelivered_replies": 0,
+    }
+    for st in shards:
+        for key in ("messages", "graded", "quality_sum", "llm_calls", "input_tokens", "output_tokens", "cost_usd", "undelivered_replies"):
+            total[key] += st[key]
+        for key in ("by_status", "recommendations"):
+            for k, v in st[key].items():
+                total[key][k] = total[key].get(k, 0) + v
+    total["cost_usd"] = round(total["cost_usd"], 4)
+    total["avg_quality_score"] = round(total["quality_sum"] / total["graded"], 2) if total["graded"] else None
+    return total
+
+def get_meta(key: str) -> Optional[str]:
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM bot_meta WHERE key=?", (key,))
+    row = cur.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def set_meta(key: str, value: str):
     conn = db()
     cur = conn.cursor()
+    cur.execute("""
+      INSERT INTO bot_meta(key, value, updated_at) VALUES (?, ?, ?)
+      ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
+    """, (key, value, now_iso()))
+    conn.commit()
+    conn.close()
+
+def get_active_session(channel_id: int):
+    path = shard_for_channel(channel_id)
+    if path is None:
+        return None
+    conn = db(path)
+    cur = conn.cursor()
     cur.execute("""
       SELECT id, candidate_id, question_index
       FROM sessions
@@ -162,7 +709,10 @@ def get_active_session(channel_id: int):
     return row  # (id, candidate_id, question_index) or None
 
 def get_last_session(channel_id: int):
-    conn = db()
+    path = shard_for_channel(channel_id)
+    if path is None:
+        return None
+    conn = db(path)
     cur = conn.cursor()
     cur.execute("""
       SELECT id, candidate_id
@@ -176,7 +726,7 @@ def get_last_session(channel_id: int):
     return row  # (id, candidate_id) or None
 
 def add_message(session_id: int, role: str, content: str, author_id: Optional[str] = None):
-    conn = db()
+    conn = session_db(session_id)
     cur = conn.cursor()
     cur.execute("""
       INSERT INTO messages(session_id, role, author_id, content, created_at)
@@ -188,7 +738,7 @@ def add_message(session_id: int, role: str, content: str, author_id: Optional[st
     return msg_id
 
 def fetch_transcript_rows(session_id: int):
-    conn = db()
+    conn = session_db(session_id)
     cur = conn.cursor()
     cur.execute("""
       SELECT role, author_id, content, created_at
@@ -215,12 +765,12 @@ def get_last_interviewer_question(session_id: int) -> str:
     return ""
 
 def save_answer_assessment(session_id: int, message_id: int, question_text: str, answer_text: str, assessment: Dict[str, Any]):
-    conn = db()
+    conn = session_db(session_id)
     cur = conn.cursor()
     cur.execute(
         """
-        INSERT INTO answer_assessments(session_id, message_id, question_text, answer_text, quality_score, correctness, reasoning, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO answer_assessments(session_id, message_id, question_text, answer_text, quality_score, correctness, reasoning, created_at, categories_json)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
         (
             session_id,
@@ -231,13 +781,14 @@ def save_answer_assessment(session_id: int, message_id: int, question_text: str,
             str(assessment.get("correctness", "unclear")),
             str(assessment.get("reasoning", "")),
             now_iso(),
+            json.dumps(assessment.get("categories") or []),
         ),
     )
     conn.commit()
     conn.close()
 
 def get_latest_assessment(session_id: int) -> Dict[str, Any]:
-    conn = db()
+    conn = session_db(session_id)
     cur = conn.cursor()
     cur.execute(
         """
@@ -255,11 +806,46 @@ def get_latest_assessment(session_id: int) -> Dict[str, Any]:
         return {}
     return {"quality_score": row[0], "correctness": row[1], "reasoning": row[2]}
 
+def get_conversation(session_id: int) -> Optional[str]:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("SELECT response_id, profile, started_at FROM llm_conversations WHERE session_id=?", (session_id,))
+    row = cur.fetchone()
+    conn.close()
+    if not row or row[1] != ACTIVE_PROFILE or time.time() - row[2] > RESPONSE_CHAIN_TTL_SECONDS:
+        return None
+    return row[0]
+
+def start_conversation(session_id: int, response_id: str):
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("""
+      INSERT OR REPLACE INTO llm_conversations(session_id, response_id, profile, started_at, updated_at)
+      VALUES (?, ?, ?, ?, ?)
+    """, (session_id, response_id, ACTIVE_PROFILE, time.time(), time.time()))
+    conn.commit()
+    conn.close()
+
+def update_conversation(session_id: int, response_id: str):
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("UPDATE llm_conversations SET response_id=?, updated_at=? WHERE session_id=?", (response_id, time.time(), session_id))
+    conn.commit()
+    conn.close()
+
+def has_assessment(session_id: int, message_id: int) -> bool:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM answer_assessments WHERE message_id=? LIMIT 1", (message_id,))
+    row = cur.fetchone()
+    conn.close()
+    return row is not None
+
 def default_coverage():
     return {k: {"covered": False, "evidence_count": 0} for k in TARGET_CATEGORIES}
 
 def get_or_create_state(session_id: int) -> Dict[str, Any]:
-    conn = db()
+    conn = session_db(session_id)
     cur = conn.cursor()
     cur.execute("""
       SELECT session_id, resume_text, turn_count, coverage_json
@@ -286,7 +872,7 @@ def get_or_create_state(session_id: int) -> Dict[str, Any]:
     }
 
 def save_state(session_id: int, resume_text: str, turn_count: int, coverage: Dict[str, Any]):
-    conn = db()
+    conn = session_db(session_id)
     cur = conn.cursor()
     cur.execute("""
       UPDATE session_state
@@ -338,20 +924,320 @@ def fallback_question_for_coverage(coverage: Dict[str, Any]) -> str:
         return "Describe a time you faced an ethical choice and how you made the decision."
     return "Give one concrete example that best shows why we should admit you." 
 
+# ============================================================
+# Resume ingestion & retrieval
+# ============================================================
+# Resumes are split into sections/chunks and indexed with BM25 at ingestion time.
+# Each question prompt then gets only the chunks relevant to the uncovered
+# categories and the latest answer instead of the first 8000 characters.
+
+RESUME_HEADINGS = {
+    "summary", "profile", "objective", "education", "experience", "work experience",
+    "professional experience", "employment", "projects", "research", "publications",
+    "skills", "technical skills", "leadership", "activities", "extracurricular activities",
+    "volunteer", "volunteering", "awards", "honors", "honors and awards", "certifications",
+    "languages", "interests", "coursework", "relevant coursework",
+    "个人信息", "个人简介", "教育背景", "教育经历", "工作经历", "实习经历", "项目经历",
+    "科研经历", "专业技能", "技能", "获奖情况", "荣誉奖项", "论文发表", "自我评价",
+}
+
+EN_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "that", "the", "this", "to",
+    "was", "we", "what", "when", "which", "why", "with", "you", "your",
+}
+
+def parse_resume_file(filename: str, data: bytes) -> str:
+    # Runs in the resume parse process pool; must stay a plain top-level function.
+    name = (filename or "").lower()
+    if name.endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ValueError("PDF resumes need the `pypdf` package (pip install pypdf).")
+        reader = PdfReader(io.BytesIO(data))
+        return "\n".join((page.extract_text() or "") for page in reader.pages)
+    if name.endswith(".docx"):
+        ns = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            # file_size is what read() will return at most, so check it before unzipping
+            if zf.getinfo("word/document.xml").file_size > RESUME_MAX_XML_BYTES:
+                raise ValueError("DOCX document is too large once unzipped.")
+            root = ElementTree.fromstring(zf.read("word/document.xml"))
+        paragraphs = ["".join(t.text or "" for t in p.iter(f"{ns}t")) for p in root.iter(f"{ns}p")]
+        return "\n".join(paragraphs)
+    if name.endswith(".txt") or name.endswith(".md"):
+        return data.decode("utf-8-sig", errors="replace")
+    raise ValueError("Unsupported resume file type. Use PDF, DOCX or TXT.")
+
+RESUME_PARSE_POOL = None
+
+async def parse_resume_attachment(filename: str, data: bytes) -> str:
+    global RESUME_PARSE_POOL
+    if RESUME_PARSE_POOL is None:
+        RESUME_PARSE_POOL = ProcessPoolExecutor(max_workers=max(1, RESUME_PARSE_WORKERS))
+    pool = RESUME_PARSE_POOL
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(pool, parse_resume_file, filename, data), RESUME_PARSE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        # The stuck parse keeps its worker busy until killed: retire the pool
+        # (parses still running in it fail) and start a fresh one next time.
+        if RESUME_PARSE_POOL is pool:
+            RESUME_PARSE_POOL = None
+        for proc in list(getattr(pool, "_processes", {}).values()):
+            proc.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise ValueError(f"parsing took longer than {RESUME_PARSE_TIMEOUT_SECONDS:.0f}s")
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for word in re.findall(r"[a-z0-9][a-z0-9+#]*|[\u4e00-\u9fff]+", (text or "").lower()):
+        if "\u4e00" <= word[0] <= "\u9fff":
+            # CJK has no spaces: index character bigrams (single char if the run is 1 long)
+            tokens.extend(word[i:i + 2] for i in range(max(1, len(word) - 1)))
+        elif word not in EN_STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+def is_resume_heading(line: str) -> bool:
+    s = line.strip().strip("#").strip().rstrip(":：").strip()
+    if not s or len(s) > 40:
+        return False
+    if s.lower() in RESUME_HEADINGS or line.strip().startswith("#"):
+        return True
+    letters = [ch for ch in s if ch.isalpha()]
+    return len(letters) >= 3 and s.isupper() and len(s.split()) <= 4
+
+def chunk_resume(text: str, max_chars: int = RESUME_CHUNK_CHARS) -> List[Tuple[str, str]]:
+    sections = []  # (section, lines)
+    section, lines = "header", []
+    for line in (text or "").splitlines():
+        if is_resume_heading(line):
+            if any(l.strip() for l in lines):
+                sections.append((section, lines))
+            section, lines = line.strip().strip("#").strip().rstrip(":：").strip(), []
+        else:
+            lines.append(line.rstrip())
+    if any(l.strip() for l in lines):
+        sections.append((section, lines))
+
+    chunks = []
+    for section, lines in sections:
+        buf = ""
+        for line in lines:
+            if not line.strip():
+                continue
+            if buf and len(buf) + len(line) + 1 > max_chars:
+                chunks.append((section, buf))
+                buf = ""
+            # hard-wrap pathological single lines (e.g. PDF text without newlines)
+            while len(line) > max_chars:
+                chunks.append((section, line[:max_chars]))
+                line = line[max_chars:]
+            buf = f"{buf}\n{line}" if buf else line
+        if buf:
+            chunks.append((section, buf))
+    return chunks
+
+def save_resume(session_id: int, resume_text: str) -> int:
+    chunks = chunk_resume(resume_text)
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM resume_chunks WHERE session_id=?", (session_id,))
+    for i, (section, content) in enumerate(chunks):
+        tokens = tokenize(f"{section}\n{content}")
+        tf = {}
+        for t in tokens:
+            tf[t] = tf.get(t, 0) + 1
+        cur.execute("""
+          INSERT INTO resume_chunks(session_id, chunk_index, section, content, term_freq_json, length)
+          VALUES (?, ?, ?, ?, ?, ?)
+        """, (session_id, i, section, content, json.dumps(tf, ensure_ascii=False), len(tokens)))
+    cur.execute("UPDATE session_state SET resume_text=? WHERE session_id=?", (resume_text, session_id))
+    cur.execute("DELETE FROM llm_conversations WHERE session_id=?", (session_id,))  # chain holds old excerpts
+    conn.commit()
+    conn.close()
+    return len(chunks)
+
+def search_resume(session_id: int, query: str, k: int = RESUME_TOP_K) -> List[Dict[str, Any]]:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("""
+      SELECT chunk_index, section, content, term_freq_json, length
+      FROM resume_chunks
+      WHERE session_id=?
+      ORDER BY chunk_index ASC
+    """, (session_id,))
+    rows = cur.fetchall()
+    conn.close()
+    if not rows:
+        return []
+
+    # Okapi BM25 (k1=1.5, b=0.75)
+    docs = [(r[0], r[1], r[2], json.loads(r[3] or "{}"), int(r[4] or 0)) for r in rows]
+    n = len(docs)
+    avg_len = sum(d[4] for d in docs) / n or 1.0
+    q_terms = set(tokenize(query))
+    df = {t: sum(1 for d in docs if t in d[3]) for t in q_terms}
+    scored = []
+    for idx, section, content, tf, length in docs:
+        score = 0.0
+        for t in q_terms:
+            f = tf.get(t, 0)
+            if not f:
+                continue
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            score += idf * f * 2.5 / (f + 1.5 * (1 - 0.75 + 0.75 * length / avg_len))
+        scored.append((score, idx, section, content))
+
+    top = [x for x in sorted(scored, key=lambda x: (-x[0], x[1])) if x[0] > 0][:k]
+    if not top:
+        top = scored[:k]  # nothing matches (e.g. first turn): lead with the top of the resume
+    # present in resume order so the excerpt still reads naturally
+    return [{"chunk_index": i, "section": sec, "content": c, "score": round(sc, 3)} for sc, i, sec, c in sorted(top, key=lambda x: x[1])]
+
+def resume_excerpt_for_turn(session_id: int, state: Dict[str, Any], latest_answer: str, last_question: str = "") -> str:
+    uncovered = [k for k in TARGET_CATEGORIES if not state["coverage"].get(k, {}).get("covered")]
+    query = " ".join([latest_answer or "", last_question or ""] + [k.replace("_", " ") for k in uncovered[:2]])
+    hits = search_resume(session_id, query)
+    if not hits:
+        # sessions stored before chunking existed
+        return (state.get("resume_text") or "")[:8000]
+    return "\n\n".join(f"[{h['section']}]\n{h['content']}" for h in hits)
+
 # ============================================================
 # OpenAI helpers
 # ============================================================
 
-if not OPENAI_API_KEY:
-    raise RuntimeError("Missing OPENAI_API_KEY env var")
+client = None  # created lazily by get_client()
+
+def get_client():
+    global client
+    if client is None:
+        if not OPENAI_API_KEY:
+            raise RuntimeError("Missing OPENAI_API_KEY env var")
+        t0 = time.perf_counter()
+        from openai import OpenAI
+        client = OpenAI(api_key=OPENAI_API_KEY)
+        print(f"OpenAI client ready in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    return client
+
+def _merge_routing(base: Dict[str, Any], override: Dict[str, Any]):
+    for profile, stages in (override or {}).items():
+        for stage, cfg in (stages or {}).items():
+            base.setdefault(profile, {}).setdefault(stage, {}).update(cfg or {})
+
+if os.getenv("MODEL_ROUTING_JSON"):
+    _merge_routing(MODEL_ROUTING, json.loads(os.getenv("MODEL_ROUTING_JSON")))
+
+STAGE_LATENCIES = {}  # (profile, stage, model) -> deque of seconds
+STAGE_DOWNGRADED_UNTIL = {}  # (profile, stage) -> monotonic deadline
+ROUTING_LOCK = threading.Lock()
+
+def p95(values) -> float:
+    vals = sorted(values)
+    if not vals:
+        return 0.0
+    return vals[min(len(vals) - 1, int(math.ceil(0.95 * len(vals))) - 1)]
+
+def get_route(stage: str, profile: Optional[str] = None) -> Dict[str, Any]:
+    profile = profile or ACTIVE_PROFILE
+    route = dict(MODEL_ROUTING["*"][stage])
+    route.update(MODEL_ROUTING.get(profile, {}).get(stage, {}))
+    route["downgraded"] = False
+    with ROUTING_LOCK:
+        until = STAGE_DOWNGRADED_UNTIL.get((profile, stage))
+        if until and time.monotonic() < until:
+            route["model"] = route["fallback_model"]
+            route["downgraded"] = True
+        elif until:
+            # cool-down over: give the primary model a fresh window
+            STAGE_DOWNGRADED_UNTIL.pop((profile, stage), None)
+            STAGE_LATENCIES.pop((profile, stage, route["model"]), None)
+    return route
+
+def record_stage_latency(profile: str, stage: str, route: Dict[str, Any], seconds: float):
+    key = (profile, stage, route["model"])
+    with ROUTING_LOCK:
+        window = STAGE_LATENCIES.setdefault(key, deque(maxlen=ROUTING_WINDOW))
+        window.append(seconds)
+        if route["downgraded"] or route["model"] == route["fallback_model"] or len(window) < ROUTING_MIN_SAMPLES:
+            return
+        recent_p95 = p95(window)
+        if recent_p95 > route["latency_budget_s"]:
+            STAGE_DOWNGRADED_UNTIL[(profile, stage)] = time.monotonic() + ROUTING_DOWNGRADE_SECONDS
+            print(
+                f"[routing] {profile}/{stage}: p95 {recent_p95:.1f}s > budget {route['latency_budget_s']:.1f}s; "
+                f"{route['model']} -> {route['fallback_model']} for {ROUTING_DOWNGRADE_SECONDS:.0f}s"
+            )
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+def call_llm(stage: str, prompt: str, session_id: Optional[int] = None, previous_response_id: Optional[str] = None):
+    profile = ACTIVE_PROFILE
+    route = get_route(stage, profile)
+    if session_id is not None:
+        mode = budget_mode(session_id)
+        if mode == "bank" and stage != "evaluate":
+            raise RuntimeError(f"LLM budget exhausted for session #{session_id}")
+        if mode != "ok":
+            route["model"] = BUDGET_CHEAP_MODEL
+            route["downgraded"] = True
+    extra = {"previous_response_id": previous_response_id} if previous_response_id else {}
+    timeout = route["latency_budget_s"] * ROUTING_TIMEOUT_FACTOR
+    t0 = time.monotonic()
+    resp, slow = None, False
+    try:
+        resp = get_client().responses.create(
+            model=route["model"],
+            input=prompt,
+            temperature=route["temperature"],
+            max_output_tokens=route["max_output_tokens"],
+            timeout=timeout,
+            **extra,
+        )
+        return resp
+    except Exception as e:
+        status = getattr(e, "status_code", None)
+        # Timeouts, connection errors, 5xx and 429 count as over budget. Other
+        # 4xx (e.g. an expired previous_response_id) say nothing about latency.
+        slow = status is None or status >= 500 or status in (408, 429)
+        raise
+    finally:
+        seconds = time.monotonic() - t0
+        if resp is None and slow:
+            seconds = max(seconds, timeout)
+        record_stage_latency(profile, stage, route, seconds)
+        if resp is not None and session_id is not None:
+            record_llm_usage(session_id, stage, route["model"], getattr(resp, "usage", None), seconds)
+
+def routing_summary(profile: Optional[str] = None) -> str:
+    parts = []
+    for stage in MODEL_ROUTING["*"]:
+        route = get_route(stage, profile)
+        with ROUTING_LOCK:
+            window = list(STAGE_LATENCIES.get((profile or ACTIVE_PROFILE, stage, route["model"]), []))
+        note = " (downgraded)" if route["downgraded"] else ""
+        latency = f", p95 {p95(window):.1f}s/{route['latency_budget_s']:g}s" if window else ""
+        parts.append(f"{stage}=`{route['model']}`{note}{latency}")
+    return "Models: " + ", ".join(parts)
 
 ACTIVE_PROFILE = DEFAULT_PROFILE if DEFAULT_PROFILE in PROFILE_MAP else "admissions"
 ACTIVE_SKILL_PATH = PROFILE_MAP[ACTIVE_PROFILE]["skill"]
 ACTIVE_RUBRIC_PATH = PROFILE_MAP[ACTIVE_PROFILE]["rubric"]
-SKILL_TEXT = read_file_safe(ACTIVE_SKILL_PATH, fallback="(SKILL.md not found)")
-RUBRIC_TEXT = read_file_safe(ACTIVE_RUBRIC_PATH, fallback="(rubric.md not found)")
+SKILL_TEXT = None  # profile docs are read on first use
+RUBRIC_TEXT = None
+
+def get_skill_text() -> str:
+    global SKILL_TEXT
+    if SKILL_TEXT is None:
+        SKILL_TEXT = read_file_safe(ACTIVE_SKILL_PATH, fallback="(SKILL.md not found)")
+    return SKILL_TEXT
+
+def get_rubric_text() -> str:
+    global RUBRIC_TEXT
+    if RUBRIC_TEXT is None:
+        RUBRIC_TEXT = read_file_safe(ACTIVE_RUBRIC_PATH, fallback="(rubric.md not found)")
+    return RUBRIC_TEXT
 
 def set_active_profile(profile: str) -> bool:
     global ACTIVE_PROFILE, ACTIVE_SKILL_PATH, ACTIVE_RUBRIC_PATH, SKILL_TEXT, RUBRIC_TEXT
@@ -360,10 +1246,374 @@ def set_active_profile(profile: str) -> bool:
     ACTIVE_PROFILE = profile
     ACTIVE_SKILL_PATH = PROFILE_MAP[profile]["skill"]
     ACTIVE_RUBRIC_PATH = PROFILE_MAP[profile]["rubric"]
-    SKILL_TEXT = read_file_safe(ACTIVE_SKILL_PATH, fallback="(SKILL.md not found)")
-    RUBRIC_TEXT = read_file_safe(ACTIVE_RUBRIC_PATH, fallback="(rubric.md not found)")
+    SKILL_TEXT = None
+    RUBRIC_TEXT = None
     return True
 
+# ============================================================
+# Token accounting & budgets
+# ============================================================
+# Every session-scoped LLM call is written to llm_usage (in the session's shard)
+# with its token counts and estimated cost. Budgets degrade in two steps: over
+# budget every stage runs on BUDGET_CHEAP_MODEL; past BUDGET_HARD_FACTOR x budget
+# grading and FAQ answers stop and questions come from the question bank. The
+# final evaluation always runs (on the cheap model once over budget).
+
+SESSION_GUILDS = {}  # session_id -> guild id; never changes
+BUDGET_MODES = {}  # session_id -> last budget mode, to log transitions
+
+# Used when the profile rubric has no question bank section (ai-tech-zh has one).
+QUESTION_BANK = {
+    "admissions": {
+        "communication_clarity": [
+            "Walk me through the experience on your resume you are proudest of, start to finish.",
+            "Explain a complex idea from your field as you would to a first-year student.",
+        ],
+        "motivation_purpose": [
+            "What specifically about this program matches your goals, and why?",
+            "What problem do you want to work on after this program, and why that one?",
+        ],
+        "self_awareness_reflection": [
+            "Tell me about a failure, what you changed, and the concrete result after that change.",
+            "What feedback surprised you most, and what did you do with it?",
+        ],
+        "academic_program_fit": [
+            "Which course or faculty fit you best, and what preparation proves you can succeed?",
+            "What is the hardest course you have taken, and how did you handle it?",
+        ],
+        "leadership_initiative": [
+            "Describe one leadership example with your exact actions and measurable impact.",
+            "Tell me about something you started without being asked. What came of it?",
+        ],
+        "integrity_professionalism": [
+            "Describe a time you faced an ethical choice and how you made the decision.",
+            "Tell me about a time you had to admit a mistake to someone. What happened?",
+        ],
+    },
+}
+
+def session_guild(session_id: int) -> Optional[str]:
+    if session_id not in SESSION_GUILDS:
+        conn = session_db(session_id)
+        cur = conn.cursor()
+        cur.execute("SELECT guild_id FROM sessions WHERE id=?", (session_id,))
+        row = cur.fetchone()
+        conn.close()
+        SESSION_GUILDS[session_id] = row[0] if row else None  # NULL for sessions created before accounting
+    return SESSION_GUILDS[session_id]
+
+def model_price(model: str) -> Tuple[float, float, float]:
+    for name in sorted(MODEL_PRICING, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return MODEL_PRICING[name]
+    return max(MODEL_PRICING.values(), key=lambda p: p[2])
+
+def _usage_field(obj, name: str):
+    if obj is None:
+        return None
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+def usage_tokens(usage) -> Tuple[int, int, int]:
+    # Responses API usage: input_tokens (incl. cached), input_tokens_details.cached_tokens, output_tokens
+    input_tokens = int(_usage_field(usage, "input_tokens") or 0)
+    cached_tokens = int(_usage_field(_usage_field(usage, "input_tokens_details"), "cached_tokens") or 0)
+    output_tokens = int(_usage_field(usage, "output_tokens") or 0)
+    return input_tokens, cached_tokens, output_tokens
+
+def llm_cost(model: str, input_tokens: int, cached_tokens: int, output_tokens: int) -> float:
+    p_in, p_cached, p_out = model_price(model)
+    return ((input_tokens - cached_tokens) * p_in + cached_tokens * p_cached + output_tokens * p_out) / 1_000_000
+
+def record_llm_usage(session_id: int, stage: str, model: str, usage, seconds: float):
+    input_tokens, cached_tokens, output_tokens = usage_tokens(usage)
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("""
+      INSERT INTO llm_usage(session_id, guild_id, stage, model, input_tokens, cached_tokens, output_tokens, cost_usd, latency_ms, created_at)
+      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        session_id, session_guild(session_id), stage, model, input_tokens, cached_tokens, output_tokens,
+        llm_cost(model, input_tokens, cached_tokens, output_tokens), int(seconds * 1000), now_iso(),
+    ))
+    conn.commit()
+    conn.close()
+
+def session_cost(session_id: int) -> float:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(SUM(cost_usd), 0) FROM llm_usage WHERE session_id=?", (session_id,))
+    cost = cur.fetchone()[0]
+    conn.close()
+    return cost
+
+def guild_cost_today(guild_id: str) -> float:
+    day_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    path = existing_shard_for_guild(guild_id)
+    if path is None:
+        return 0.0
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(SUM(cost_usd), 0) FROM llm_usage WHERE guild_id=? AND created_at>=?", (str(guild_id), day_start))
+    cost = cur.fetchone()[0]
+    conn.close()
+    return cost
+
+def budget_mode(session_id: int) -> str:
+    # "ok" | "cheap" (over budget) | "bank" (over budget * BUDGET_HARD_FACTOR)
+    if SESSION_BUDGET_USD <= 0 and GUILD_DAILY_BUDGET_USD <= 0:
+        return "ok"
+    ratio = 0.0
+    if SESSION_BUDGET_USD > 0:
+        ratio = session_cost(session_id) / SESSION_BUDGET_USD
+    guild_id = session_guild(session_id)
+    if GUILD_DAILY_BUDGET_USD > 0 and guild_id is not None:
+        ratio = max(ratio, guild_cost_today(guild_id) / GUILD_DAILY_BUDGET_USD)
+    mode = "bank" if ratio >= BUDGET_HARD_FACTOR else "cheap" if ratio >= 1.0 else "ok"
+    previous = BUDGET_MODES.get(session_id, "ok")
+    if mode != previous:
+        print(f"[budget] session #{session_id}: {previous} -> {mode} ({ratio:.0%} of budget)")
+    BUDGET_MODES[session_id] = mode
+    return mode
+
+def next_bank_question(session_id: int, coverage: Dict[str, Any]) -> str:
+    # Rubric bank first, then the built-in bank with uncovered categories first.
+    bank = list(get_compiled_profile()["bank"])
+    builtin = QUESTION_BANK.get(ACTIVE_PROFILE, {})
+    uncovered = [k for k in builtin if coverage.get(k, {}).get("covered") is not True]
+    for key in uncovered + [k for k in builtin if k not in uncovered]:
+        bank.extend(builtin[key])
+    asked = get_recent_interviewer_questions(session_id, limit=MAX_TURNS * 2)
+    for question in bank:
+        if not any(is_similar_question(question, q) for q in asked):
+            return question
+    return fallback_question_for_coverage(coverage)
+
+def spend_summary(session_id: Optional[int], guild_id: Optional[int]) -> str:
+    lines = []
+    if session_id is not None:
+        conn = session_db(session_id)
+        cur = conn.cursor()
+        cur.execute("""
+          SELECT stage, COUNT(*), SUM(input_tokens), SUM(cached_tokens), SUM(output_tokens), SUM(cost_usd)
+          FROM llm_usage
+          WHERE session_id=?
+          GROUP BY stage
+          ORDER BY stage ASC
+        """, (session_id,))
+        rows = cur.fetchall()
+        conn.close()
+        total = sum(r[5] for r in rows)
+        budget = f"${SESSION_BUDGET_USD:g}" if SESSION_BUDGET_USD > 0 else "unlimited"
+        lines.append(f"Session #{session_id}: **${total:.4f}** of {budget} (mode: {budget_mode(session_id)})")
+        for stage, calls, tin, tcached, tout, cost in rows:
+            lines.append(f"- {stage}: {calls} calls, {tin} in ({tcached} cached) / {tout} out tokens, ${cost:.4f}")
+    if guild_id is not None:
+        budget = f"${GUILD_DAILY_BUDGET_USD:g}" if GUILD_DAILY_BUDGET_USD > 0 else "unlimited"
+        lines.append(f"This server today (UTC): **${guild_cost_today(str(guild_id)):.4f}** of {budget}")
+    return "\n".join(lines)
+
+# ============================================================
+# Rubric compilation
+# ============================================================
+# Each profile's SKILL.md / rubric.md is compiled once into sections: scale
+# anchors, numbered categories (with parsed indicator bullets) and policy
+# sections. Per-turn prompts (grading, next question) only carry the anchors,
+# the turn-level rules and the categories in play; final evaluation still
+# gets the full documents.
+
+TURN_POLICY_PATTERN = r"rule|guardrail|规则|约束|追问策略|强制"
+QUESTION_BANK_PATTERN = r"question bank|题库"
+COMPILED_PROFILES = {}  # (skill_path, rubric_path) -> compiled dict
+
+def split_markdown_sections(text: str) -> Tuple[str, List[Tuple[str, str]]]:
+    preamble, sections = [], []
+    for line in (text or "").splitlines():
+        m = re.match(r"^##\s+(.+?)\s*$", line)
+        if m:
+            sections.append((m.group(1), []))
+        elif sections:
+            sections[-1][1].append(line)
+        else:
+            preamble.append(line)
+
+    def clean(lines):
+        return "\n".join(l for l in lines if l.strip() != "---").strip()
+
+    return clean(preamble), [(title, clean(body)) for title, body in sections]
+
+def category_key(title: str, number: int) -> str:
+    t = re.sub(r"^\d+\)\s*", "", title)
+    t = re.sub(r"^optional:\s*", "", t, flags=re.IGNORECASE)
+    t = re.sub(r"[（(].*?[）)]", "", t)
+    key = re.sub(r"[^a-z0-9]+", "_", t.lower()).strip("_")
+    return key or f"category_{number}"
+
+def parse_indicators(body: str) -> List[Tuple[str, List[str]]]:
+    # "**High-score indicators (8-10)**" / "高分信号：" headings followed by "- " bullets
+    groups = []
+    for line in body.splitlines():
+        s = line.strip()
+        if not s:
+            continue
+        if s.startswith(("- ", "* ")):
+            if not groups:
+                groups.append(("", []))
+            groups[-1][1].append(s[2:].strip())
+        else:
+            groups.append((s.strip("*").rstrip(":：").strip(), []))
+    return groups
+
+def compile_profile_docs(skill_text: str, rubric_text: str) -> Dict[str, Any]:
+    preamble, sections = split_markdown_sections(rubric_text)
+    anchors, categories, other, bank = "", [], [], []
+    for title, body in sections:
+        m = re.match(r"^(\d+)\)\s*", title)
+        if m:
+            number = int(m.group(1))
+            categories.append({
+                "key": category_key(title, number),
+                "number": number,
+                "title": title,
+                "optional": bool(re.search(r"optional|可选", title, re.IGNORECASE)),
+                "indicators": parse_indicators(body),
+                "tokens": set(tokenize(f"{title}\n{body}")),
+            })
+        elif not anchors and re.search(r"anchor|锚点", title, re.IGNORECASE):
+            anchors = body
+        elif re.search(QUESTION_BANK_PATTERN, title, re.IGNORECASE):
+            # numbered questions, possibly grouped under ### topics
+            bank.extend(m.group(1) for m in re.finditer(r"^\s*\d+[.)、]\s*(.+?)\s*$", body, re.MULTILINE))
+        else:
+            other.append((title, body))
+
+    _skill_pre, skill_sections = split_markdown_sections(skill_text)
+    policy = [(t, b) for t, b in skill_sections + other if re.search(TURN_POLICY_PATTERN, t, re.IGNORECASE)]
+    return {"preamble": preamble, "anchors": anchors, "categories": categories, "policy": policy, "bank": bank}
+
+def get_compiled_profile() -> Dict[str, Any]:
+    key = (ACTIVE_SKILL_PATH, ACTIVE_RUBRIC_PATH)
+    compiled = COMPILED_PROFILES.get(key)
+    if compiled is None:
+        compiled = COMPILED_PROFILES[key] = compile_profile_docs(get_skill_text(), get_rubric_text())
+    return compiled
+
+def categories_in_play(compiled: Dict[str, Any], coverage: Dict[str, Any], query: str, limit: int = 2) -> List[Dict[str, Any]]:
+    cats = [c for c in compiled["categories"] if not c["optional"]] or compiled["categories"]
+    uncovered = [c for c in cats if coverage.get(c["key"], {}).get("covered") is not True] or cats
+    q = set(tokenize(query))
+    ranked = sorted(enumerate(uncovered), key=lambda ic: (-len(q & ic[1]["tokens"]), ic[0]))
+    return [c for _, c in ranked[:limit]]
+
+def render_category(cat: Dict[str, Any]) -> str:
+    lines = [f"### {cat['title']}"]
+    for name, bullets in cat["indicators"]:
+        if bullets:
+            lines.append(f"- {name + ': ' if name else ''}{'; '.join(bullets)}")
+        elif name:
+            lines.append(f"- {name}")
+    return "\n".join(lines)
+
+def turn_policy_docs(coverage: Dict[str, Any], query: str, char_limit: int) -> str:
+    compiled = get_compiled_profile()
+    if not compiled["categories"]:
+        # rubric missing or not in the numbered-section format: old behaviour
+        return f"--- SKILL.md ---\n{get_skill_text()[:char_limit]}\n--- rubric.md ---\n{get_rubric_text()[:char_limit]}"
+
+    parts = ["--- Interview rules ---"]
+    parts.extend(f"## {title}\n{body}" for title, body in compiled["policy"])
+    parts.append("--- Rubric (scale anchors apply to every category) ---")
+    if compiled["preamble"]:
+        parts.append(compiled["preamble"])
+    if compiled["anchors"]:
+        parts.append(compiled["anchors"])
+    parts.append("Categories in play this turn:")
+    parts.append(render_categories_in_play(coverage, query))
+    return "\n\n".join(parts)
+
+def render_categories_in_play(coverage: Dict[str, Any], query: str) -> str:
+    # "" when the rubric has no compiled categories (the raw docs are sent instead)
+    compiled = get_compiled_profile()
+    if not compiled["categories"]:
+        return ""
+    return "\n\n".join(render_category(c) for c in categories_in_play(compiled, coverage, query))
+
+# ============================================================
+# Evidence coverage (early termination)
+# ============================================================
+# Each graded answer counts as evidence for the rubric categories the grader
+# tagged (or, for untagged rows, the categories whose rubric text it overlaps
+# most). Evidence strength depends on how conclusive the grade was; the score
+# estimate per category is the evidence-weighted mean quality score.
+
+EVIDENCE_WEIGHTS = {"correct": 1.0, "partially_correct": 0.8, "incorrect": 0.8, "unclear": 0.3}
+GRADING_FALLBACK_REASON = "Auto-grading unavailable; treated as unclear."  # not evidence
+
+def evidence_categories() -> List[str]:
+    keys = [c["key"] for c in get_compiled_profile()["categories"] if not c["optional"]]
+    return keys or list(TARGET_CATEGORIES)
+
+def match_categories(text: str, limit: int = 2) -> List[str]:
+    cats = [c for c in get_compiled_profile()["categories"] if not c["optional"]]
+    q = set(tokenize(text))
+    scored = sorted(((len(q & c["tokens"]), c["key"]) for c in cats), reverse=True)
+    return [key for overlap, key in scored[:limit] if overlap >= 2]
+
+def fetch_assessments(session_id: int) -> List[Tuple[str, str, int, str, Optional[str]]]:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("""
+      SELECT question_text, answer_text, quality_score, correctness, categories_json
+      FROM answer_assessments
+      WHERE session_id=? AND COALESCE(reasoning, '') != ?
+      ORDER BY id ASC
+    """, (session_id, GRADING_FALLBACK_REASON))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+def evidence_coverage(session_id: int) -> Dict[str, Any]:
+    keys = evidence_categories()
+    evidence = {k: 0.0 for k in keys}
+    weighted = {k: 0.0 for k in keys}
+    history = []  # estimates after each graded answer
+    last_evidence = {k: -1 for k in keys}  # index of the last answer that touched the category
+    for question_text, answer_text, quality_score, correctness, categories_json in fetch_assessments(session_id):
+        cats = [k for k in json.loads(categories_json or "[]") if k in evidence]
+        if not cats:
+            cats = match_categories(f"{question_text or ''}\n{answer_text}")
+        w = EVIDENCE_WEIGHTS.get(correctness, 0.3)
+        for k in cats:
+            evidence[k] += w
+            weighted[k] += w * (quality_score or 3)
+            last_evidence[k] = len(history)
+        history.append({k: weighted[k] / evidence[k] for k in keys if evidence[k] > 0})
+
+    categories = {
+        k: {
+            "evidence": round(evidence[k], 2),
+            "confidence": round(evidence[k] / (evidence[k] + EVIDENCE_PRIOR_WEIGHT), 2),
+            "estimate": round(weighted[k] / evidence[k], 2) if evidence[k] else None,
+        }
+        for k in keys
+    }
+    stop, reason = False, ""
+    if history and all(c["confidence"] >= EVIDENCE_CONFIDENCE_THRESHOLD for c in categories.values()):
+        stop, reason = True, f"every category at confidence >= {EVIDENCE_CONFIDENCE_THRESHOLD:g}"
+    elif (
+        len(history) > EVIDENCE_STABLE_TURNS and len(history) >= EVIDENCE_MIN_TURNS
+        and all(c["confidence"] >= EVIDENCE_STABLE_MIN_CONFIDENCE for c in categories.values())
+    ):
+        # a category nobody asked about can't move; it only counts as stable if
+        # it got new evidence inside the window and still barely moved
+        window_start = len(history) - EVIDENCE_STABLE_TURNS
+        before = history[window_start - 1]
+        if all(
+            last_evidence[k] >= window_start and k in before and abs(history[-1][k] - before[k]) < EVIDENCE_STABLE_DELTA
+            for k in keys
+        ):
+            stop, reason = True, f"estimates stable over the last {EVIDENCE_STABLE_TURNS} answers"
+    return {"categories": categories, "answers": len(history), "stop": stop, "reason": reason}
+
 def safe_json_parse(text: str) -> Dict[str, Any]:
     text = text.strip()
     # try raw JSON
@@ -413,6 +1663,8 @@ def brave_search(query: str, count: int = 3) -> str:
     if not BRAVE_API_KEY:
         return ""
     try:
+        import requests
+
         url = f"https://api.search.brave.com/res/v1/web/search?q={quote_plus(query)}&count={count}"
         headers = {"Accept": "application/json", "X-Subscription-Token": BRAVE_API_KEY}
         r = requests.get(url, headers=headers, timeout=8)
@@ -430,6 +1682,11 @@ def brave_search(query: str, count: int = 3) -> str:
         return ""
 
 def answer_candidate_question(question: str, session_id: int) -> str:
+    guild_id = session_guild(session_id)
+    cached = faq_cache_lookup(guild_id, question)
+    if cached:
+        return cached["answer"]
+
     tr = transcript_text(session_id)
     snippets = brave_search(question)
     lang_rule = "Reply only in Simplified Chinese (简体中文)." if ACTIVE_PROFILE == "ai-tech-zh" else "Reply in English."
@@ -446,25 +1703,39 @@ Interview context:
 
 Optional web search snippets:
 {snippets if snippets else '(none)'}
-"""
+
+Return STRICT JSON only:
+{{"answer": "your reply", "reusable": false}}
+Set "reusable" to true only for general program/process/logistics questions whose answer would be the same for any candidate; false if it depends on this interview or this candidate.
+"""
     try:
-        resp = client.responses.create(model=OPENAI_MODEL, input=prompt, temperature=0.2)
-        return (resp.output_text or "Good question. I’ll note it and we can revisit at the end.").strip()
+        resp = call_llm("faq", prompt, session_id)
+        text = (resp.output_text or "").strip()
+        try:
+            data = safe_json_parse(text)
+            answer, reusable = str(data.get("answer") or "").strip(), data.get("reusable") is True
+        except Exception:
+            answer, reusable = text, False  # plain-text reply; answer it but don't cache
+        if not answer:
+            return "Good question. I’ll note it and we can revisit at the end."
+        if reusable and FAQ_CACHE_ENABLED:
+            save_faq_answer(guild_id, question, answer)
+        return answer
     except Exception:
         return "Good question. I can’t verify that right now, but I’ll note it and we can revisit at the end."
 
 def assess_candidate_answer(session_id: int, question_text: str, answer_text: str) -> Dict[str, Any]:
     tr = transcript_text(session_id)
     state = get_or_create_state(session_id)
+    policy_docs = turn_policy_docs({}, f"{question_text}\n{answer_text}", 5000)
+    category_keys = evidence_categories()
     prompt = f"""
 You are grading a candidate answer during an interview.
 Profile: {ACTIVE_PROFILE}
+Rubric category keys: {", ".join(category_keys)}
 
 Use rubric policy excerpts:
---- SKILL.md ---
-{SKILL_TEXT[:5000]}
---- rubric.md ---
-{RUBRIC_TEXT[:5000]}
+{policy_docs}
 
 Question asked:
 {question_text}
@@ -479,7 +1750,8 @@ Return STRICT JSON only:
 {{
   "quality_score": 1,
   "correctness": "correct|partially_correct|incorrect|unclear",
-  "reasoning": "one short sentence"
+  "reasoning": "one short sentence",
+  "categories": ["rubric category keys this answer gives evidence for (1-2)"]
 }}
 Scoring guidance:
 - quality_score 1-5 (1 poor, 5 excellent)
@@ -487,7 +1759,7 @@ Scoring guidance:
 - if insufficient evidence, use "unclear"
 """
     try:
-        resp = client.responses.create(model=OPENAI_MODEL, input=prompt, temperature=0.1)
+        resp = call_llm("grade", prompt, session_id)
         data = safe_json_parse(resp.output_text)
         q = int(data.get("quality_score", 0) or 0)
         if q < 1 or q > 5:
@@ -499,16 +1771,74 @@ Scoring guidance:
             "quality_score": q,
             "correctness": c,
             "reasoning": str(data.get("reasoning", ""))[:240],
+            "categories": [k for k in (data.get("categories") or []) if k in category_keys][:3],
         }
     except Exception:
-        return {"quality_score": 3, "correctness": "unclear", "reasoning": "Auto-grading unavailable; treated as unclear."}
+        return {"quality_score": 3, "correctness": "unclear", "reasoning": GRADING_FALLBACK_REASON}
 
 def generate_next_question(session_id: int, latest_candidate_answer: str) -> str:
     state = get_or_create_state(session_id)
-    tr = transcript_text(session_id)
     recent_questions = get_recent_interviewer_questions(session_id)
     latest_assessment = get_latest_assessment(session_id)
-    resume_text = (state.get("resume_text") or "")[:8000]
+    evidence = {k: v["confidence"] for k, v in evidence_coverage(session_id)["categories"].items()}
+    last_question = get_last_interviewer_question(session_id)  # not an FAQ answer
+    state_lines = f"""- profile: {ACTIVE_PROFILE}
+- turn_count: {state["turn_count"]}
+- max_turns: {MAX_TURNS}
+- coverage_json: {json.dumps(state["coverage"], ensure_ascii=False)}
+- recent_questions: {json.dumps(recent_questions, ensure_ascii=False)}
+- latest_answer_assessment: {json.dumps(latest_assessment, ensure_ascii=False)}
+- evidence_confidence (0-1 per category, from graded answers): {json.dumps(evidence, ensure_ascii=False)}"""
+
+    resp = None
+    previous_id = get_conversation(session_id) if STATEFUL_QUESTIONS else None
+    if previous_id:
+        # The stored conversation already holds the rules, resume and earlier
+        # turns, but only the categories that were in play back then.
+        in_play = render_categories_in_play(state["coverage"], f"{last_question}\n{latest_candidate_answer}")
+        in_play = f"\nRubric categories in play this turn:\n{in_play}\n" if in_play else ""
+        prompt = f"""
+Continue as the adaptive interviewer with the same rules and the same STRICT JSON output.
+{in_play}
+Current interview state:
+{state_lines}
+
+Interviewer asked:
+{last_question}
+
+Latest candidate answer:
+{latest_candidate_answer}
+"""
+        try:
+            resp = call_llm("question", prompt, session_id, previous_response_id=previous_id)
+            update_conversation(session_id, resp.id)
+        except Exception as e:
+            if getattr(e, "status_code", None) not in (400, 404):
+                raise
+            print(f"[conversation] session #{session_id}: {previous_id} unusable ({e}); rebuilding")
+
+    if resp is None:
+        resp = call_llm("question", full_question_prompt(session_id, state, state_lines, last_question, latest_candidate_answer), session_id)
+        if STATEFUL_QUESTIONS:
+            start_conversation(session_id, resp.id)
+
+    out = resp.output_text
+    data = safe_json_parse(out)
+
+    coverage = data.get("coverage_update", state["coverage"])
+    turn_count = state["turn_count"] + 1
+    save_state(session_id, state["resume_text"], turn_count, coverage)
+
+    default_q = "请给出一个包含你的动作、指标和结果的具体案例。" if ACTIVE_PROFILE == "ai-tech-zh" else "Give one concrete example with your actions and measurable impact."
+    question = data.get("question", default_q)
+    if any(is_similar_question(question, q) for q in recent_questions):
+        question = fallback_question_for_coverage(coverage)
+    return question
+
+def full_question_prompt(session_id: int, state: Dict[str, Any], state_lines: str, last_question: str, latest_candidate_answer: str) -> str:
+    tr = transcript_text(session_id)
+    resume_text = resume_excerpt_for_turn(session_id, state, latest_candidate_answer, last_question)
+    policy_docs = turn_policy_docs(state["coverage"], f"{last_question}\n{latest_candidate_answer}", 12000)
 
     profile_mode_note = (
         "You are interviewing for a senior AI engineer role. Ask technically deep, implementation-focused questions quickly. Reply ONLY in Simplified Chinese (简体中文)."
@@ -516,25 +1846,17 @@ def generate_next_question(session_id: int, latest_candidate_answer: str) -> str
         else "You are interviewing for college admissions. Ask concise evidence-based questions."
     )
 
-    prompt = f"""
+    return f"""
 You are an adaptive interviewer.
 {profile_mode_note}
 
 Use these policy docs:
---- SKILL.md ---
-{SKILL_TEXT[:12000]}
---- rubric.md ---
-{RUBRIC_TEXT[:12000]}
+{policy_docs}
 
 Current interview state:
-- profile: {ACTIVE_PROFILE}
-- turn_count: {state["turn_count"]}
-- max_turns: {MAX_TURNS}
-- coverage_json: {json.dumps(state["coverage"], ensure_ascii=False)}
-- recent_questions: {json.dumps(recent_questions, ensure_ascii=False)}
-- latest_answer_assessment: {json.dumps(latest_assessment, ensure_ascii=False)}
+{state_lines}
 
-Resume (if provided):
+Resume excerpts most relevant to this turn (if provided):
 {resume_text if resume_text else '(none)'}
 
 Transcript:
@@ -551,7 +1873,7 @@ Task:
 5) If candidate made vague/inflated claims, ask for concrete verification.
 6) Keep question short: <= 18 words, no preamble, no two-part question.
 7) Do NOT repeat or paraphrase any question in recent_questions.
-8) Make interview fast: move forward when a category already has enough evidence.
+8) Make interview fast: move forward when a category already has enough evidence; target the lowest evidence_confidence first.
 9) For ai-tech-zh profile, prefer technical AI topics first (memory, eval, agent reliability, tuning).
 10) If latest_answer_assessment.correctness is incorrect/unclear, ask a corrective follow-up immediately.
 
@@ -570,24 +1892,6 @@ Return STRICT JSON only:
 }}
 """
 
-    resp = client.responses.create(
-        model=OPENAI_MODEL,
-        input=prompt,
-        temperature=0.2
-    )
-    out = resp.output_text
-    data = safe_json_parse(out)
-
-    coverage = data.get("coverage_update", state["coverage"])
-    turn_count = state["turn_count"] + 1
-    save_state(session_id, state["resume_text"], turn_count, coverage)
-
-    default_q = "请给出一个包含你的动作、指标和结果的具体案例。" if ACTIVE_PROFILE == "ai-tech-zh" else "Give one concrete example with your actions and measurable impact."
-    question = data.get("question", default_q)
-    if any(is_similar_question(question, q) for q in recent_questions):
-        question = fallback_question_for_coverage(coverage)
-    return question
-
 def run_final_evaluation(session_id: int, candidate_id: str) -> Dict[str, Any]:
     state = get_or_create_state(session_id)
     tr = transcript_text(session_id)
@@ -598,9 +1902,9 @@ You are a college admissions evaluator.
 
 Use these policy docs:
 --- SKILL.md ---
-{SKILL_TEXT[:15000]}
+{get_skill_text()[:15000]}
 --- rubric.md ---
-{RUBRIC_TEXT[:15000]}
+{get_rubric_text()[:15000]}
 
 Candidate ID: {candidate_id}
 
@@ -642,14 +1946,929 @@ Rules:
 - No protected-attribute inference.
 """
 
-    resp = client.responses.create(
-        model=OPENAI_MODEL,
-        input=prompt,
-        temperature=0.2
-    )
+    resp = call_llm("evaluate", prompt, session_id)
     out = resp.output_text
     return safe_json_parse(out)
 
+# ============================================================
+# FAQ answer cache
+# ============================================================
+# Answers the FAQ model marks as reusable (general program / process questions,
+# not about this interview) are cached per profile and guild in the guild's
+# shard. A lookup vectorizes the normalized question as char n-gram TF-IDF and
+# takes the nearest cached question above FAQ_CACHE_THRESHOLD whose content
+# words also match one for one (char n-grams alone rate "off-campus" close to
+# "on-campus" and "the application deadline" close to "the scholarship
+# application deadline"); admin-pinned answers win over cached ones and never
+# expire. Each process keeps an in-memory index per (shard, profile, guild),
+# refreshed every FAQ_INDEX_REFRESH_SECONDS or when it writes.
+
+FAQ_INDEXES = {}  # (path, profile, guild_id) -> {"expires", "entries", "idf", "default_idf"}
+FAQ_CONTRAST_WORDS = {"on", "off", "in", "out", "not", "no", "before", "after", "without", "over", "under"}
+FAQ_STOPWORDS = (EN_STOPWORDS - {"what", "when", "which", "why", "how"} - FAQ_CONTRAST_WORDS) | {  # "where"/"who" are not in EN_STOPWORDS
+    "there", "any", "am", "can", "could", "does", "has", "have", "will", "would", "should", "tell", "know", "us", "our",
+}
+FAQ_WH_WORDS = {"what", "when", "where", "who", "which", "why", "how"}
+FAQ_CJK_FUNCTION_CHARS = set("的了吗呢吧啊呀么是什有")
+FAQ_FILLER_PATTERN = r"\b(quick question|i have a question|can i ask|may i ask|just wondering|i was wondering|please|sorry)\b"
+
+def normalize_question(text: str) -> str:
+    t = unicodedata.normalize("NFKC", text or "").lower()
+    t = re.sub(r"^\s*(question|q)\s*[:：]\s*", "", t)
+    t = re.sub(FAQ_FILLER_PATTERN, " ", t)
+    t = re.sub(r"\b(what|when|where|who|how)['’]s\b", r"\1", t)
+    t = "".join(ch if ch.isalnum() else " " for ch in t)
+    return " ".join(w for w in t.split() if w not in FAQ_STOPWORDS)
+
+def question_kind(norm: str) -> frozenset:
+    # "when" vs "where" differ by one n-gram but need different answers; what/which are wildcards
+    return frozenset(w for w in norm.split() if w in ("when", "where", "who", "why", "how"))
+
+def content_words(norm: str) -> List[str]:
+    # English words minus wh-words; CJK runs count per character.
+    words = []
+    for w in norm.split():
+        if w in FAQ_WH_WORDS:
+            continue
+        if re.search(r"[\u4e00-\u9fff]", w):
+            words.extend(ch for ch in w if ch not in FAQ_CJK_FUNCTION_CHARS)
+        else:
+            words.append(w)
+    return words
+
+def _word_stem(w: str) -> str:
+    return w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+
+def same_content_words(a: List[str], b: List[str]) -> bool:
+    # Every content word needs a counterpart on the other side: same stem, or
+    # one a prefix of the other ("deadline" / "deadlines", typos cut short).
+    def has_partner(w, others):
+        stem = _word_stem(w)
+        return any(stem == _word_stem(o) or (min(len(w), len(o)) >= 5 and (w.startswith(o) or o.startswith(w))) for o in others)
+    return all(has_partner(w, b) for w in a) and all(has_partner(w, a) for w in b)
+
+def char_ngrams(text: str) -> Dict[str, int]:
+    sizes = (2, 3) if re.search(r"[\u4e00-\u9fff]", text) else (3,)
+    padded = f" {text} "
+    grams = {}
+    for n in sizes:
+        for i in range(len(padded) - n + 1):
+            g = padded[i:i + n]
+            grams[g] = grams.get(g, 0) + 1
+    return grams
+
+def tfidf_vector(grams: Dict[str, int], idf: Dict[str, float], default_idf: float) -> Dict[str, float]:
+    vec = {g: (1 + math.log(c)) * idf.get(g, default_idf) for g, c in grams.items()}
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {g: v / norm for g, v in vec.items()}
+
+def faq_location(guild_id, create: bool = False) -> Tuple[Optional[str], str]:
+    # Only writes create the guild's shard; reads get None when it has none.
+    gid = str(guild_id or 0)
+    return (shard_for_guild(gid) if create else existing_shard_for_guild(gid)), gid
+
+def load_faq_index(path: str, guild_id: str) -> Dict[str, Any]:
+    key = (path, ACTIVE_PROFILE, guild_id)
+    index = FAQ_INDEXES.get(key)
+    if index and index["expires"] > time.monotonic():
+        return index
+
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM faq_cache WHERE pinned=0 AND expires_at < ?", (time.time(),))
+    cur.execute("""
+      SELECT id, question, norm_question, answer, pinned, expires_at
+      FROM faq_cache
+      WHERE profile=? AND guild_id=?
+    """, (ACTIVE_PROFILE, guild_id))
+    rows = cur.fetchall()
+    conn.commit()
+    conn.close()
+
+    grams = [char_ngrams(r[2]) for r in rows]
+    df = {}
+    for g in grams:
+        for k in g:
+            df[k] = df.get(k, 0) + 1
+    n = len(rows)
+    idf = {k: math.log((1 + n) / (1 + v)) + 1 for k, v in df.items()}
+    default_idf = math.log(1 + n) + 1  # n-grams no cached question has
+    entries = [
+        {
+            "id": r[0], "question": r[1], "answer": r[3], "pinned": bool(r[4]), "expires_at": r[5],
+            "kind": question_kind(r[2]), "words": content_words(r[2]), "vec": tfidf_vector(g, idf, default_idf),
+        }
+        for r, g in zip(rows, grams)
+    ]
+    index = FAQ_INDEXES[key] = {
+        "expires": time.monotonic() + FAQ_INDEX_REFRESH_SECONDS, "entries": entries, "idf": idf, "default_idf": default_idf,
+    }
+    return index
+
+def faq_cache_lookup(guild_id, question: str) -> Optional[Dict[str, Any]]:
+    norm = normalize_question(question)
+    if not FAQ_CACHE_ENABLED or not norm:
+        return None
+    path, gid = faq_location(guild_id)
+    if path is None:
+        return None
+    index = load_faq_index(path, gid)
+    if not index["entries"]:
+        return None
+
+    qvec = tfidf_vector(char_ngrams(norm), index["idf"], index["default_idf"])
+    kind = question_kind(norm)
+    words = content_words(norm)
+    now = time.time()
+    best, best_sim = None, 0.0
+    for entry in index["entries"]:
+        if not entry["pinned"] and entry["expires_at"] < now:
+            continue
+        if kind and entry["kind"] and not (kind & entry["kind"]):
+            continue
+        sim = sum(w * entry["vec"].get(g, 0.0) for g, w in qvec.items())
+        if sim < FAQ_CACHE_THRESHOLD or not same_content_words(words, entry["words"]):
+            continue
+        if best is None or (entry["pinned"], sim) > (best["pinned"], best_sim):
+            best, best_sim = entry, sim
+    if best is None:
+        return None
+
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("UPDATE faq_cache SET hits=hits+1 WHERE id=?", (best["id"],))
+    conn.commit()
+    conn.close()
+    return {"id": best["id"], "question": best["question"], "answer": best["answer"], "pinned": best["pinned"], "similarity": round(best_sim, 3)}
+
+def save_faq_answer(guild_id, question: str, answer: str, pinned: bool = False) -> Optional[int]:
+    norm = normalize_question(question)
+    if not norm:
+        return None
+    path, gid = faq_location(guild_id, create=True)
+    conn = db(path)
+    cur = conn.cursor()
+    # a cached answer never overwrites a pinned one
+    cur.execute("""
+      INSERT INTO faq_cache(profile, guild_id, question, norm_question, answer, pinned, expires_at, created_at)
+      VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+      ON CONFLICT(profile, guild_id, norm_question) DO UPDATE SET
+        question=excluded.question, answer=excluded.answer, pinned=excluded.pinned, expires_at=excluded.expires_at
+      WHERE excluded.pinned=1 OR faq_cache.pinned=0
+    """, (
+        ACTIVE_PROFILE, gid, question.strip(), norm, answer.strip(), int(pinned),
+        None if pinned else time.time() + FAQ_CACHE_TTL_SECONDS, now_iso(),
+    ))
+    cur.execute("SELECT id FROM faq_cache WHERE profile=? AND guild_id=? AND norm_question=?", (ACTIVE_PROFILE, gid, norm))
+    row = cur.fetchone()
+    conn.commit()
+    conn.close()
+    FAQ_INDEXES.pop((path, ACTIVE_PROFILE, gid), None)
+    return row[0] if row else None
+
+def pin_faq_entry(guild_id, entry_id: int) -> bool:
+    path, gid = faq_location(guild_id)
+    if path is None:
+        return False
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("UPDATE faq_cache SET pinned=1, expires_at=NULL WHERE id=? AND profile=? AND guild_id=?", (entry_id, ACTIVE_PROFILE, gid))
+    changed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    FAQ_INDEXES.pop((path, ACTIVE_PROFILE, gid), None)
+    return changed
+
+def remove_faq_entry(guild_id, entry_id: int) -> bool:
+    path, gid = faq_location(guild_id)
+    if path is None:
+        return False
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM faq_cache WHERE id=? AND profile=? AND guild_id=?", (entry_id, ACTIVE_PROFILE, gid))
+    changed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    FAQ_INDEXES.pop((path, ACTIVE_PROFILE, gid), None)
+    return changed
+
+def list_faq_entries(guild_id, limit: int = 15) -> List[Tuple[int, str, int, int]]:
+    path, gid = faq_location(guild_id)
+    if path is None:
+        return []
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("""
+      SELECT id, question, pinned, hits
+      FROM faq_cache
+      WHERE profile=? AND guild_id=? AND (pinned=1 OR expires_at >= ?)
+      ORDER BY pinned DESC, hits DESC, id DESC
+      LIMIT ?
+    """, (ACTIVE_PROFILE, gid, time.time(), limit))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+# ============================================================
+# Durable job queue
+# ============================================================
+# on_message only stores the candidate message and enqueues jobs in the same
+# transaction. Workers (in the bot process, or `python bot.py worker`) claim jobs
+# with a lease, do the LLM work and write replies to the outbox; the bot process
+# delivers the outbox. Jobs left unfinished by a crash are re-claimed once their
+# lease expires. Jobs of one session run strictly in enqueue order.
+
+WORKER_ID_PREFIX = f"{socket.gethostname()}:{os.getpid()}"
+IS_WORKER_PROCESS = False
+OUTBOX_MAX_ATTEMPTS = 5
+
+JOB_WAKEUP = asyncio.Event()
+OUTBOX_WAKEUP = asyncio.Event()
+BACKGROUND_TASKS = []
+
+def _insert_job(cur, kind: str, session_id: int, payload: Dict[str, Any], idempotency_key: str) -> int:
+    ts = now_iso()
+    cur.execute("""
+      INSERT OR IGNORE INTO jobs(kind, session_id, idempotency_key, payload_json, created_at, updated_at)
+      VALUES (?, ?, ?, ?, ?, ?)
+    """, (kind, session_id, idempotency_key, json.dumps(payload, ensure_ascii=False), ts, ts))
+    if cur.rowcount:
+        return cur.lastrowid
+    cur.execute("SELECT id FROM jobs WHERE idempotency_key=?", (idempotency_key,))
+    return cur.fetchone()[0]
+
+def enqueue_job(kind: str, session_id: int, payload: Dict[str, Any], idempotency_key: str) -> int:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    job_id = _insert_job(cur, kind, session_id, payload, idempotency_key)
+    conn.commit()
+    conn.close()
+    mark_shard_busy(shard_for_session(session_id))
+    return job_id
+
+def record_candidate_turn(session_id: int, channel_id: int, author_id: str, content: str, discord_message_id: int) -> Optional[int]:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM jobs WHERE idempotency_key=?", (f"grade:{discord_message_id}",))
+    if cur.fetchone():
+        conn.close()
+        return None  # already recorded (duplicate gateway event)
+
+    cur.execute("""
+      INSERT INTO messages(session_id, role, author_id, content, created_at)
+      VALUES (?, 'candidate', ?, ?, ?)
+    """, (session_id, author_id, content, now_iso()))
+    msg_id = cur.lastrowid
+
+    payload = {
+        "channel_id": str(channel_id),
+        "message_id": msg_id,
+        "content": content,
+        "profile": ACTIVE_PROFILE,
+    }
+    if candidate_asked_question(content):
+        _insert_job(cur, "faq", session_id, payload, f"faq:{discord_message_id}")
+    _insert_job(cur, "grade", session_id, payload, f"grade:{discord_message_id}")
+    _insert_job(cur, "question", session_id, payload, f"question:{discord_message_id}")
+    conn.commit()
+    conn.close()
+    mark_shard_busy(shard_for_session(session_id))
+    return msg_id
+
+# Sharded: a shard with nothing to claim is skipped by every worker in this
+# process for a growing interval (up to JOB_IDLE_SHARD_MAX_SECONDS), so idle
+# polls do not open every tenant's file each second. Anything this process
+# queues or finishes in a shard clears its skip; jobs queued by other processes
+# are found once the skip runs out.
+SHARD_IDLE_UNTIL = {}  # shard path -> monotonic time
+SHARD_IDLE_BACKOFF = {}  # shard path -> seconds
+
+def mark_shard_busy(path: str):
+    SHARD_IDLE_UNTIL.pop(path, None)
+    SHARD_IDLE_BACKOFF.pop(path, None)
+
+def claim_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    # Start at a random shard so workers spread across tenants.
+    paths = all_shard_paths()
+    start = random.randrange(len(paths)) if paths else 0
+    now = time.monotonic()
+    for path in paths[start:] + paths[:start]:
+        if SHARDED and SHARD_IDLE_UNTIL.get(path, 0.0) > now:
+            continue
+        job = _claim_job_in(path, worker_id)
+        if job is not None:
+            mark_shard_busy(path)
+            return job
+        if SHARDED:
+            backoff = min(JOB_IDLE_SHARD_MAX_SECONDS, max(JOB_POLL_SECONDS, 2 * SHARD_IDLE_BACKOFF.get(path, 0.0)))
+            SHARD_IDLE_BACKOFF[path] = backoff
+            SHARD_IDLE_UNTIL[path] = now + backoff
+    return None
+
+def _claim_job_in(path: str, worker_id: str) -> Optional[Dict[str, Any]]:
+    # Plain read first, so idle polls never take the shard's write lock. The
+    # claim is a compare-and-set on status and attempts; if another worker got
+    # the job in between, read again. A job whose lease ran out (or was
+    # released) after its last attempt is failed here instead of leased again,
+    # otherwise it would block the rest of its session forever.
+    conn = db(path)
+    cur = conn.cursor()
+    while True:
+        now = time.time()
+        cur.execute("""
+          SELECT j.id, j.kind, j.session_id, j.idempotency_key, j.payload_json, j.attempts
+          FROM jobs AS j
+          WHERE ((j.status='pending' AND j.available_at<=?) OR (j.status='leased' AND j.lease_expires_at<?))
+            AND NOT EXISTS (
+              SELECT 1 FROM jobs AS prev
+              WHERE prev.session_id=j.session_id AND prev.id<j.id AND prev.status IN ('pending', 'leased')
+            )
+          ORDER BY j.id ASC
+          LIMIT 1
+        """, (now, now))
+        row = cur.fetchone()
+        if not row:
+            conn.close()
+            return None
+
+        if int(row[5]) >= JOB_MAX_ATTEMPTS:
+            abandon_job({"id": row[0], "kind": row[1], "session_id": row[2], "key": row[3], "payload": json.loads(row[4] or "{}")})
+            cur.execute("""
+              UPDATE jobs
+              SET status='failed', lease_owner=NULL, lease_expires_at=NULL, last_error=?, updated_at=?
+              WHERE id=? AND attempts=?
+                AND ((status='pending' AND available_at<=?) OR (status='leased' AND lease_expires_at<?))
+            """, (f"lease lost after {row[5]} attempts", now_iso(), row[0], row[5], now, now))
+            if cur.rowcount == 1:
+                print(f"[jobs] {row[1]} #{row[0]} failed: lease lost after {row[5]} attempts")
+            conn.commit()
+            continue
+
+        attempts = int(row[5]) + 1
+        cur.execute("""
+          UPDATE jobs
+          SET status='leased', attempts=?, lease_owner=?, lease_expires_at=?, updated_at=?
+          WHERE id=? AND attempts=?
+            AND ((status='pending' AND available_at<=?) OR (status='leased' AND lease_expires_at<?))
+        """, (attempts, worker_id, now + JOB_LEASE_SECONDS, now_iso(), row[0], row[5], now, now))
+        claimed = cur.rowcount == 1
+        conn.commit()
+        if claimed:
+            break
+
+    conn.close()
+    return {
+        "id": row[0],
+        "kind": row[1],
+        "session_id": row[2],
+        "key": row[3],
+        "payload": json.loads(row[4] or "{}"),
+        "attempts": attempts,
+        "shard": path,
+    }
+
+def complete_job(job: Dict[str, Any], worker_id: str):
+    conn = db(job["shard"])
+    cur = conn.cursor()
+    cur.execute("""
+      UPDATE jobs
+      SET status='done', lease_owner=NULL, lease_expires_at=NULL, updated_at=?
+      WHERE id=? AND lease_owner=?
+    """, (now_iso(), job["id"], worker_id))
+    conn.commit()
+    conn.close()
+    mark_shard_busy(job["shard"])  # the session's next job may be claimable now
+
+def fail_job(job: Dict[str, Any], worker_id: str, error: str):
+    status = "failed" if job["attempts"] >= JOB_MAX_ATTEMPTS else "pending"
+    retry_at = time.time() + 2 ** job["attempts"]
+    conn = db(job["shard"])
+    cur = conn.cursor()
+    cur.execute("""
+      UPDATE jobs
+      SET status=?, available_at=?, lease_owner=NULL, lease_expires_at=NULL, last_error=?, updated_at=?
+      WHERE id=? AND lease_owner=?
+    """, (status, retry_at, error[:1000], now_iso(), job["id"], worker_id))
+    conn.commit()
+    conn.close()
+    mark_shard_busy(job["shard"])
+
+def renew_job_lease(job: Dict[str, Any], worker_id: str) -> bool:
+    conn = db(job["shard"])
+    cur = conn.cursor()
+    cur.execute("""
+      UPDATE jobs
+      SET lease_expires_at=?
+      WHERE id=? AND status='leased' AND lease_owner=?
+    """, (time.time() + JOB_LEASE_SECONDS, job["id"], worker_id))
+    renewed = cur.rowcount == 1
+    conn.commit()
+    conn.close()
+    return renewed
+
+def _lease_owner_alive(owner: str) -> bool:
+    # Worker ids are "host:pid:wN". Only processes on this host can be checked;
+    # anything else keeps its lease until it expires.
+    parts = (owner or "").split(":")
+    if len(parts) < 2 or parts[0] != socket.gethostname() or not parts[1].isdigit():
+        return True
+    pid = int(parts[1])
+    if pid == os.getpid():
+        return False  # a previous process that had our pid
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def release_dead_leases() -> int:
+    # Called once before this process starts workers: jobs leased by local
+    # processes that no longer exist go straight back to pending.
+    released = 0
+    for path in all_shard_paths():
+        conn = db(path)
+        cur = conn.cursor()
+        cur.execute("SELECT DISTINCT lease_owner FROM jobs WHERE status='leased'")
+        dead = [r[0] for r in cur.fetchall() if not _lease_owner_alive(r[0])]
+        for owner in dead:
+            cur.execute("""
+              UPDATE jobs
+              SET status='pending', available_at=0, lease_owner=NULL, lease_expires_at=NULL, updated_at=?
+              WHERE status='leased' AND lease_owner=?
+            """, (now_iso(), owner))
+            released += cur.rowcount
+        conn.commit()
+        conn.close()
+        if dead:
+            mark_shard_busy(path)
+    if released:
+        print(f"[jobs] released {released} job(s) leased by stopped workers")
+    return released
+
+def queue_reply(session_id: int, channel_id: str, content: str, idempotency_key: str, transcript: bool = True) -> bool:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("""
+      INSERT OR IGNORE INTO outbox(session_id, channel_id, content, idempotency_key, created_at)
+      VALUES (?, ?, ?, ?, ?)
+    """, (session_id, str(channel_id), content, idempotency_key, now_iso()))
+    inserted = cur.rowcount == 1
+    if inserted and transcript:
+        cur.execute("""
+          INSERT INTO messages(session_id, role, author_id, content, created_at)
+          VALUES (?, 'interviewer', NULL, ?, ?)
+        """, (session_id, content, now_iso()))
+    conn.commit()
+    conn.close()
+    return inserted
+
+def outbox_has(session_id: int, idempotency_key: str) -> bool:
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM outbox WHERE idempotency_key=?", (idempotency_key,))
+    row = cur.fetchone()
+    conn.close()
+    return row is not None
+
+def _fetch_unsent_in(path: str, limit: int):
+    conn = db(path)
+    cur = conn.cursor()
+    cur.execute("""
+      SELECT id, channel_id, content, parts_sent
+      FROM outbox
+      WHERE sent_at IS NULL AND failed_at IS NULL AND attempts<?
+      ORDER BY id ASC
+      LIMIT ?
+    """, (OUTBOX_MAX_ATTEMPTS, limit))
+    rows = [((path, r[0]), r[1], r[2], r[3]) for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+def fetch_unsent_replies(limit: int = 20):
+    # Rows are ((shard_path, outbox_id), channel_id, content, parts_sent); a channel lives
+    # in exactly one shard, so per-channel order is the outbox id order.
+    return [row for shard in fan_out(lambda path: _fetch_unsent_in(path, limit)) for row in shard]
+
+def mark_reply_sent(ref: Tuple[str, int]):
+    conn = db(ref[0])
+    cur = conn.cursor()
+    cur.execute("UPDATE outbox SET sent_at=?, attempts=attempts+1 WHERE id=?", (now_iso(), ref[1]))
+    conn.commit()
+    conn.close()
+
+def mark_reply_parts_sent(ref: Tuple[str, int], parts_sent: int):
+    conn = db(ref[0])
+    cur = conn.cursor()
+    cur.execute("UPDATE outbox SET parts_sent=? WHERE id=?", (parts_sent, ref[1]))
+    conn.commit()
+    conn.close()
+
+def mark_reply_failed(ref: Tuple[str, int]) -> bool:
+    # Returns True when the row has used up its attempts and is given up on.
+    conn = db(ref[0])
+    cur = conn.cursor()
+    cur.execute("""
+      UPDATE outbox
+      SET attempts=attempts+1, failed_at=CASE WHEN attempts+1>=? THEN ? END
+      WHERE id=?
+    """, (OUTBOX_MAX_ATTEMPTS, now_iso(), ref[1]))
+    cur.execute("SELECT failed_at FROM outbox WHERE id=?", (ref[1],))
+    row = cur.fetchone()
+    conn.commit()
+    conn.close()
+    return bool(row and row[0])
+
+# Jobs read the profile globals (docs, routing, FAQ cache) while they build
+# prompts, so the profile only changes while no job is running. Jobs under the
+# current profile run side by side; a switch (a standalone worker picking up a
+# job enqueued under another profile, or /set_profile) waits for them to finish,
+# and new jobs wait behind a pending switch.
+PROFILE_GATE = threading.Condition()
+PROFILE_JOBS_RUNNING = 0
+PROFILE_SWITCHES_WAITING = 0
+
+def enter_job_profile(profile: Optional[str]):
+    global PROFILE_JOBS_RUNNING, PROFILE_SWITCHES_WAITING
+    with PROFILE_GATE:
+        while PROFILE_SWITCHES_WAITING and (not profile or profile == ACTIVE_PROFILE):
+            PROFILE_GATE.wait()
+        if profile and profile != ACTIVE_PROFILE:
+            PROFILE_SWITCHES_WAITING += 1
+            while PROFILE_JOBS_RUNNING:
+                PROFILE_GATE.wait()
+            PROFILE_SWITCHES_WAITING -= 1
+            set_active_profile(profile)
+        PROFILE_JOBS_RUNNING += 1
+
+def leave_job_profile():
+    global PROFILE_JOBS_RUNNING
+    with PROFILE_GATE:
+        PROFILE_JOBS_RUNNING -= 1
+        PROFILE_GATE.notify_all()
+
+def switch_profile(profile: str) -> bool:
+    # Blocking; call from a thread.
+    if profile not in PROFILE_MAP:
+        return False
+    enter_job_profile(profile)
+    leave_job_profile()
+    return True
+
+def handle_faq_job(job: Dict[str, Any]):
+    p = job["payload"]
+    key = f"{job['key']}:reply"
+    if outbox_has(job["session_id"], key):
+        return
+    answer = answer_candidate_question(p["content"], job["session_id"])
+    queue_reply(job["session_id"], p["channel_id"], answer, key)
+
+def handle_grade_job(job: Dict[str, Any]):
+    p = job["payload"]
+    if has_assessment(job["session_id"], p["message_id"]):
+        return
+    if budget_mode(job["session_id"]) == "bank":
+        return  # no grading once the hard budget is spent
+    last_q = get_last_interviewer_question(job["session_id"])
+    assessment = assess_candidate_answer(job["session_id"], last_q, p["content"])
+    save_answer_assessment(job["session_id"], p["message_id"], last_q, p["content"], assessment)
+
+def handle_question_job(job: Dict[str, Any]):
+    p = job["payload"]
+    session_id = job["session_id"]
+    key = f"{job['key']}:reply"
+    if outbox_has(job["session_id"], key):
+        return
+
+    st = get_or_create_state(session_id)
+    evidence = evidence_coverage(session_id)
+    if evidence["stop"]:
+        print(f"[coverage] session #{session_id}: ending after {evidence['answers']} graded answers ({evidence['reason']})")
+    if st["turn_count"] >= MAX_TURNS or enough_coverage(st["coverage"]) or evidence["stop"]:
+        done_msg = "我们已经收集到足够证据。请运行 `/end_interview`，然后 `/evaluate`。" if ACTIVE_PROFILE == "ai-tech-zh" else "Thanks — we now have enough evidence. Please run `/end_interview`, then `/evaluate`."
+        queue_reply(session_id, p["channel_id"], done_msg, key, transcript=False)
+        return
+
+    if budget_mode(session_id) == "bank":
+        question = next_bank_question(session_id, st["coverage"])
+        save_state(session_id, st["resume_text"], st["turn_count"] + 1, st["coverage"])
+        queue_reply(session_id, p["channel_id"], question, key)
+        return
+
+    try:
+        question = generate_next_question(session_id, p["content"])
+    except Exception:
+        question = fallback_next_question(ACTIVE_PROFILE)
+    queue_reply(session_id, p["channel_id"], question, key)
+
+def fallback_next_question(profile: str) -> str:
+    return "请给出一个包含你的具体动作、指标和结果的案例。" if profile == "ai-tech-zh" else "Give one concrete example with your exact actions and measurable impact."
+
+def handle_evaluate_job(job: Dict[str, Any]):
+    p = job["payload"]
+    session_id = job["session_id"]
+    candidate_id = p["candidate_id"]
+    key = job["key"]
+    if outbox_has(session_id, f"{key}:0"):
+        return
+
+    try:
+        result = run_final_evaluation(session_id, candidate_id)
+    except Exception as e:
+        if job["attempts"] < JOB_MAX_ATTEMPTS:
+            raise
+        queue_reply(session_id, p["channel_id"], f"Evaluation failed: {e}", f"{key}:0", transcript=False)
+        return
+
+    result_text = (
+        f"**Evaluation for {candidate_id}**\n"
+        f"- Recommendation: **{result.get('recommendation', 'N/A')}**\n"
+        f"- Confidence: **{result.get('confidence', 'N/A')}**\n\n"
+        f"```json\n{json.dumps(result, indent=2, ensure_ascii=False)}\n```"
+    )
+
+    # The reply and the evaluations row are written together, and only by the
+    # first run to get here, so a job that ran twice stores one evaluation.
+    # The outbound sender splits the reply on line / code-fence boundaries.
+    conn = session_db(session_id)
+    cur = conn.cursor()
+    cur.execute("""
+      INSERT OR IGNORE INTO outbox(session_id, channel_id, content, idempotency_key, created_at)
+      VALUES (?, ?, ?, ?, ?)
+    """, (session_id, str(p["channel_id"]), result_text, f"{key}:0", now_iso()))
+    if cur.rowcount == 1:
+        cur.execute("""
+          INSERT INTO evaluations(session_id, result_text, result_json, created_at)
+          VALUES (?, ?, ?, ?)
+        """, (session_id, result_text, json.dumps(result, ensure_ascii=False), now_iso()))
+    conn.commit()
+    conn.close()
+
+def abandon_job(job: Dict[str, Any]):
+    # The job used up its attempts without finishing (worker died or hung).
+    # Candidates still get a reply so the interview can go on; both keys are
+    # the handlers' own, so nothing is sent twice.
+    p = job["payload"]
+    if job["kind"] == "question":
+        queue_reply(job["session_id"], p["channel_id"], fallback_next_question(p.get("profile", ACTIVE_PROFILE)), f"{job['key']}:reply")
+    elif job["kind"] == "evaluate":
+        queue_reply(job["session_id"], p["channel_id"], "Evaluation failed: the job did not finish. Please run `/evaluate` again.", f"{job['key']}:0", transcript=False)
+
+JOB_HANDLERS = {
+    "faq": handle_faq_job,
+    "grade": handle_grade_job,
+    "question": handle_question_job,
+    "evaluate": handle_evaluate_job,
+}
+
+def run_job(job: Dict[str, Any], worker_id: str) -> bool:
+    try:
+        handler = JOB_HANDLERS.get(job["kind"])
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job['kind']}")
+        # Standalone workers follow the profile the job was enqueued under. The
+        # bot process keeps whatever /set_profile chose.
+        enter_job_profile(job["payload"].get("profile") if IS_WORKER_PROCESS else None)
+        try:
+            handler(job)
+        finally:
+            leave_job_profile()
+    except Exception as e:
+        fail_job(job, worker_id, repr(e))
+        print(f"[jobs] {job['kind']} #{job['id']} failed (attempt {job['attempts']}/{JOB_MAX_ATTEMPTS}): {e}")
+        return False
+    complete_job(job, worker_id)
+    return True
+
+async def _wait_for_event(event: asyncio.Event, timeout: float):
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    event.clear()
+
+async def job_worker_loop(worker_id: str):
+    while True:
+        try:
+            job = await asyncio.to_thread(claim_job, worker_id)
+        except Exception as e:
+            print(f"[jobs] claim failed on {worker_id}: {e}")
+            job = None
+        if job is None:
+            await _wait_for_event(JOB_WAKEUP, JOB_POLL_SECONDS)
+            continue
+        # Renew the lease while the handler runs so a slow job (e.g. /evaluate)
+        # is not claimed a second time by another worker.
+        task = asyncio.ensure_future(asyncio.to_thread(run_job, job, worker_id))
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=JOB_LEASE_SECONDS / 3)
+            if done:
+                break
+            try:
+                if not await asyncio.to_thread(renew_job_lease, job, worker_id):
+                    print(f"[jobs] {job['kind']} #{job['id']} lost its lease on {worker_id}")
+            except Exception as e:
+                print(f"[jobs] lease renewal failed on {worker_id}: {e}")
+        OUTBOX_WAKEUP.set()
+        JOB_WAKEUP.set()  # the session's next job may be claimable now
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    # Split on line boundaries without dropping text. A chunk that ends inside a
+    # ``` block is closed there and the block is reopened (same tag) in the next.
+    if len(text) <= limit:
+        return [text]
+    parts, lines, fence = [], [], None
+
+    def used() -> int:
+        return sum(len(l) + 1 for l in lines)
+
+    def flush():
+        nonlocal lines
+        if lines and lines != [fence]:
+            parts.append("\n".join(lines) + ("\n```" if fence is not None else ""))
+        lines = [fence] if fence is not None else []
+
+    for line in text.split("\n"):
+        max_line = limit - len(fence or "") - 8
+        while len(line) > max_line:
+            # overlong line: hard-wrap, preferring whitespace
+            cut = line.rfind(" ", max_line // 2, max_line)
+            cut = cut if cut > 0 else max_line
+            if used() + cut + 4 > limit:
+                flush()
+            lines.append(line[:cut])
+            line = line[cut:]
+            flush()
+        if used() + len(line) + 4 > limit:  # +4 keeps room for a closing fence
+            flush()
+        lines.append(line)
+        if line.strip().startswith("```"):
+            fence = None if fence is not None else line.strip()
+    flush()
+    return parts
+
+SEND_TIMES = {}  # channel_id | "global" -> deque of send timestamps
+CHANNEL_SENDERS = {}  # channel_id -> asyncio.Queue of (outbox_id, content)
+OUTBOX_IN_FLIGHT = set()
+
+async def wait_for_send_slot(channel_id: str):
+    # Sliding-window pacing so we stay under Discord's buckets instead of eating 429s.
+    while True:
+        now = time.monotonic()
+        wait = 0.0
+        for key, (limit, per) in ((channel_id, CHANNEL_RATE_LIMIT), ("global", GLOBAL_RATE_LIMIT)):
+            window = SEND_TIMES.setdefault(key, deque())
+            while window and now - window[0] >= per:
+                window.popleft()
+            if len(window) >= limit:
+                wait = max(wait, per - (now - window[0]))
+        if wait <= 0:
+            SEND_TIMES[channel_id].append(now)
+            SEND_TIMES["global"].append(now)
+            return
+        await asyncio.sleep(wait)
+
+async def send_with_rate_limit(channel, channel_id: str, content: str, skip: int = 0, on_part=None):
+    # Parts before `skip` went out on an earlier attempt. on_part(n) is awaited
+    # after part n of a multi-part message, except the last, so the caller can
+    # record progress.
+    parts = split_message(content)
+    for i, part in enumerate(parts):
+        if i < skip:
+            continue
+        while True:
+            await wait_for_send_slot(channel_id)
+            try:
+                await channel.send(part)
+                break
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    raise
+                retry_after = float(getattr(e, "retry_after", 0) or 1.0)
+                print(f"[outbox] 429 on {channel_id}; retrying in {retry_after:.1f}s")
+                await asyncio.sleep(retry_after)
+        if on_part is not None and i + 1 < len(parts):
+            await on_part(i + 1)
+
+async def channel_sender_loop(channel_id: str, queue: asyncio.Queue):
+    pending = deque()
+    held = set()  # outbox ids this sender is responsible for
+    failures = 0
+    try:
+        while True:
+            if not pending:
+                try:
+                    pending.append(await asyncio.wait_for(queue.get(), 60))
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        return
+                    continue
+                held.add(pending[-1][0])
+                if OUTBOX_COALESCE_SECONDS > 0:
+                    await asyncio.sleep(OUTBOX_COALESCE_SECONDS)
+            while not queue.empty():
+                pending.append(queue.get_nowait())
+                held.add(pending[-1][0])
+
+            # Coalesce queued small replies into one message while they fit. A merged
+            # message is never split, so only a single long reply can be partly
+            # delivered; it records its progress and resumes on its own.
+            outbox_id, content, parts_sent = pending.popleft()
+            batch = [outbox_id]
+            while parts_sent == 0 and pending and pending[0][2] == 0 and len(content) + len(pending[0][1]) + 2 <= DISCORD_MESSAGE_LIMIT:
+                outbox_id, more, _ = pending.popleft()
+                batch.append(outbox_id)
+                content = f"{content}\n\n{more}"
+
+            channel = None
+            try:
+                channel = bot.get_channel(int(channel_id)) or await bot.fetch_channel(int(channel_id))
+                await send_with_rate_limit(
+                    channel, channel_id, content, skip=parts_sent,
+                    on_part=lambda n, ref=batch[0]: asyncio.to_thread(mark_reply_parts_sent, ref, n),
+                )
+            except Exception as e:
+                print(f"[outbox] send to {channel_id} failed: {e}")
+                gave_up = []
+                for outbox_id in batch:
+                    try:
+                        if await asyncio.to_thread(mark_reply_failed, outbox_id):
+                            gave_up.append(outbox_id)
+                    except Exception as db_error:
+                        print(f"[outbox] could not record failed send of {outbox_id}: {db_error}")
+                if gave_up:
+                    print(f"[outbox] giving up on {len(gave_up)} reply(s) to {channel_id} after {OUTBOX_MAX_ATTEMPTS} attempts (see outbox.failed_at)")
+                    notice = "⚠️ 有一条回复未能发送，请联系服务器管理员查看机器人日志。" if ACTIVE_PROFILE == "ai-tech-zh" else "⚠️ A reply could not be delivered. Please ask a server admin to check the bot logs."
+                    try:
+                        await wait_for_send_slot(channel_id)
+                        await channel.send(notice)
+                    except Exception:
+                        pass  # best effort; the row stays marked failed either way
+                # Hand everything for this channel back to the outbox so order is kept on retry.
+                batch.extend(item[0] for item in pending)
+                pending.clear()
+                OUTBOX_IN_FLIGHT.difference_update(batch)
+                held.difference_update(batch)
+                failures += 1
+                await asyncio.sleep(min(30, 2 ** failures))
+                OUTBOX_WAKEUP.set()
+                continue
+
+            failures = 0
+            for outbox_id in batch:
+                held.discard(outbox_id)
+                try:
+                    await asyncio.to_thread(mark_reply_sent, outbox_id)
+                except Exception as e:
+                    # Delivered but not recorded: keep it in flight so this
+                    # process does not send it again.
+                    print(f"[outbox] could not mark {outbox_id} sent: {e}")
+                    continue
+                OUTBOX_IN_FLIGHT.discard(outbox_id)
+    except Exception as e:
+        print(f"[outbox] sender for {channel_id} stopped: {e}")
+    finally:
+        # Idle exit or crash: let outbox_delivery_loop start a fresh sender for
+        # the channel and hand it back whatever this one still held.
+        if CHANNEL_SENDERS.get(channel_id) is queue:
+            CHANNEL_SENDERS.pop(channel_id)
+        while not queue.empty():
+            held.add(queue.get_nowait()[0])
+        OUTBOX_IN_FLIGHT.difference_update(held)
+        if held:
+            OUTBOX_WAKEUP.set()
+
+async def outbox_delivery_loop():
+    # Hands unsent outbox rows to one sender task per channel, so a slow or
+    # rate-limited channel never holds up the others.
+    await bot.wait_until_ready()
+    while True:
+        try:
+            rows = await asyncio.to_thread(fetch_unsent_replies, 100)
+        except Exception as e:
+            print(f"[outbox] fetch failed: {e}")
+            rows = []
+
+        for outbox_id, channel_id, content, parts_sent in rows:
+            if outbox_id in OUTBOX_IN_FLIGHT:
+                continue
+            queue = CHANNEL_SENDERS.get(channel_id)
+            if queue is None:
+                queue = CHANNEL_SENDERS[channel_id] = asyncio.Queue()
+                task = asyncio.create_task(channel_sender_loop(channel_id, queue))
+                BACKGROUND_TASKS.append(task)
+                task.add_done_callback(BACKGROUND_TASKS.remove)
+            OUTBOX_IN_FLIGHT.add(outbox_id)
+            queue.put_nowait((outbox_id, content, parts_sent))
+
+        await _wait_for_event(OUTBOX_WAKEUP, JOB_POLL_SECONDS)
+
+async def run_worker_process(count: int):
+    print(f"Worker process {WORKER_ID_PREFIX} running {count} worker(s) on {DB_PATH}")
+    await asyncio.to_thread(release_dead_leases)
+    await asyncio.gather(*[job_worker_loop(f"{WORKER_ID_PREFIX}:w{i}") for i in range(count)])
+
 # ============================================================
 # Discord bot setup
 # ============================================================
@@ -661,11 +2880,44 @@ intents.messages = True
 
 bot = commands.Bot(command_prefix="!", intents=intents)
 tree = bot.tree
+STARTUP_DONE = False
+
+@bot.event
+async def setup_hook():
+    # Runs once per process (not on reconnect), before the gateway connects.
+    await asyncio.to_thread(release_dead_leases)
+    for i in range(JOB_WORKERS):
+        BACKGROUND_TASKS.append(asyncio.create_task(job_worker_loop(f"{WORKER_ID_PREFIX}:w{i}")))
+    BACKGROUND_TASKS.append(asyncio.create_task(outbox_delivery_loop()))
 
 @bot.event
 async def on_ready():
+    # on_ready fires again on every reconnect; only the first one does startup work.
+    global STARTUP_DONE
     print(f"Logged in as {bot.user}")
+    if STARTUP_DONE:
+        return
+    STARTUP_DONE = True
+    mark_startup("login + gateway ready")
     print(f"Active profile: {ACTIVE_PROFILE} | skill={ACTIVE_SKILL_PATH} | rubric={ACTIVE_RUBRIC_PATH}")
+    await sync_commands_if_changed()
+    mark_startup("slash command sync")
+    print(startup_report())
+
+def command_tree_hash(scope: str) -> str:
+    payload = [cmd.to_dict(tree) for cmd in tree.get_commands()]
+    payload.sort(key=lambda c: c.get("name", ""))
+    raw = json.dumps({"scope": scope, "commands": payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def sync_commands_if_changed():
+    scope = f"guild:{GUILD_ID}" if GUILD_ID else "global"
+    meta_key = f"command_tree_hash:{scope}"
+    current = command_tree_hash(scope)
+    if not FORCE_COMMAND_SYNC and get_meta(meta_key) == current:
+        print(f"Slash commands unchanged ({current[:12]}); skipping sync")
+        return
+
     if GUILD_ID:
         guild = discord.Object(id=GUILD_ID)
         tree.copy_global_to(guild=guild)
@@ -674,6 +2926,7 @@ async def on_ready():
     else:
         await tree.sync()
         print("Synced global slash commands")
+    set_meta(meta_key, current)
 
 # --------------------------
 # Slash commands
@@ -686,21 +2939,63 @@ async def on_ready():
     app_commands.Choice(name="ai-tech-zh", value="ai-tech-zh"),
 ])
 async def set_profile(interaction: discord.Interaction, profile: app_commands.Choice[str]):
-    ok = set_active_profile(profile.value)
+    # Waits for running jobs to finish so none mixes docs from two profiles.
+    await interaction.response.defer()
+    ok = await asyncio.to_thread(switch_profile, profile.value)
     if not ok:
-        await interaction.response.send_message("Invalid profile.", ephemeral=True)
+        await interaction.followup.send("Invalid profile.", ephemeral=True)
         return
-    await interaction.response.send_message(
+    await interaction.followup.send(
         f"Profile switched to **{ACTIVE_PROFILE}**.\nSkill: `{ACTIVE_SKILL_PATH}`\nRubric: `{ACTIVE_RUBRIC_PATH}`"
     )
 
 @tree.command(name="show_profile", description="Show current interviewer profile")
 async def show_profile(interaction: discord.Interaction):
     await interaction.response.send_message(
-        f"Current profile: **{ACTIVE_PROFILE}**\nSkill: `{ACTIVE_SKILL_PATH}`\nRubric: `{ACTIVE_RUBRIC_PATH}`",
+        f"Current profile: **{ACTIVE_PROFILE}**\nSkill: `{ACTIVE_SKILL_PATH}`\nRubric: `{ACTIVE_RUBRIC_PATH}`\n{routing_summary()}",
         ephemeral=True
     )
 
+@tree.command(name="spend", description="Show LLM token usage and cost for this interview and server")
+@app_commands.default_permissions(manage_guild=True)
+async def spend(interaction: discord.Interaction):
+    active = get_active_session(interaction.channel_id) or get_last_session(interaction.channel_id)
+    summary = spend_summary(active[0] if active else None, interaction.guild_id)
+    await interaction.response.send_message(summary or "No usage recorded yet.", ephemeral=True)
+
+@tree.command(name="faq_list", description="List cached and pinned FAQ answers for this server")
+@app_commands.default_permissions(manage_guild=True)
+async def faq_list(interaction: discord.Interaction):
+    rows = list_faq_entries(interaction.guild_id)
+    if not rows:
+        await interaction.response.send_message("No cached FAQ answers yet.", ephemeral=True)
+        return
+    lines = [f"`#{fid}` {'📌 ' if pinned else ''}{question[:90]} — {hits} hits" for fid, question, pinned, hits in rows]
+    await interaction.response.send_message(f"FAQ cache (**{ACTIVE_PROFILE}**):\n" + "\n".join(lines), ephemeral=True)
+
+@tree.command(name="faq_pin", description="Pin an FAQ answer (new question + answer, or an existing entry id)")
+@app_commands.describe(question="Candidate question", answer="Answer to always give", entry_id="Existing entry from /faq_list")
+@app_commands.default_permissions(manage_guild=True)
+async def faq_pin(interaction: discord.Interaction, question: Optional[str] = None, answer: Optional[str] = None, entry_id: Optional[int] = None):
+    if entry_id is not None:
+        ok = pin_faq_entry(interaction.guild_id, entry_id)
+        msg = f"Pinned FAQ entry `#{entry_id}`." if ok else f"No FAQ entry `#{entry_id}` for this profile."
+    elif question and answer:
+        new_id = save_faq_answer(interaction.guild_id, question, answer, pinned=True)
+        msg = f"Pinned FAQ answer `#{new_id}`." if new_id else "That question is empty after normalization."
+    else:
+        msg = "Provide `question` and `answer`, or an `entry_id`."
+    await interaction.response.send_message(msg, ephemeral=True)
+
+@tree.command(name="faq_remove", description="Remove a cached or pinned FAQ answer")
+@app_commands.describe(entry_id="Entry from /faq_list")
+@app_commands.default_permissions(manage_guild=True)
+async def faq_remove(interaction: discord.Interaction, entry_id: int):
+    ok = remove_faq_entry(interaction.guild_id, entry_id)
+    await interaction.response.send_message(
+        f"Removed FAQ entry `#{entry_id}`." if ok else f"No FAQ entry `#{entry_id}` for this profile.", ephemeral=True
+    )
+
 @tree.command(name="start_interview", description="Start an adaptive interview session")
 @app_commands.describe(candidate_id="e.g., ETHANLAM", candidate="Optional: candidate user to invite into thread", private_thread="Create private thread and invite candidate")
 async def start_interview(
@@ -737,15 +3032,7 @@ async def start_interview(
         created_thread = None
         interview_channel_id = interaction.channel_id
 
-    conn = db()
-    cur = conn.cursor()
-    cur.execute("""
-      INSERT INTO sessions(candidate_id, channel_id, status, question_index, started_at)
-      VALUES (?, ?, 'active', 0, ?)
-    """, (candidate_id, str(interview_channel_id), now_iso()))
-    session_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    session_id = create_session(candidate_id, interview_channel_id, interaction.guild_id)
 
     opening_question = get_opening_question()
     _ = get_or_create_state(session_id)
@@ -794,18 +3081,44 @@ async def start_interview(
         fallback_msg += f"\n\n**Q1:** {opening_question}"
         await interaction.response.send_message(fallback_msg)
 
-@tree.command(name="set_resume", description="Attach candidate resume text to active interview")
-@app_commands.describe(resume="Paste full resume text")
-async def set_resume(interaction: discord.Interaction, resume: str):
+@tree.command(name="set_resume", description="Attach candidate resume (text or PDF/DOCX/TXT file) to active interview")
+@app_commands.describe(resume="Paste full resume text", file="Resume file (PDF, DOCX or TXT)")
+async def set_resume(interaction: discord.Interaction, resume: Optional[str] = None, file: Optional[discord.Attachment] = None):
     active = get_active_session(interaction.channel_id)
     if not active:
         await interaction.response.send_message("No active interview in this channel.", ephemeral=True)
         return
+    if not resume and file is None:
+        await interaction.response.send_message("Provide resume text or attach a PDF/DOCX/TXT file.", ephemeral=True)
+        return
+    if resume and file is not None:
+        await interaction.response.send_message("Provide either resume text or a file, not both.", ephemeral=True)
+        return
+    if file is not None and file.size > RESUME_MAX_BYTES:
+        await interaction.response.send_message(
+            f"Resume file is too large (max {RESUME_MAX_BYTES // (1024 * 1024)} MB).", ephemeral=True
+        )
+        return
 
     session_id = active[0]
-    st = get_or_create_state(session_id)
-    save_state(session_id, resume, st["turn_count"], st["coverage"])
-    await interaction.response.send_message("Resume saved for this interview session.")
+    await interaction.response.defer(thinking=True)
+    text = resume or ""
+    if file is not None:
+        try:
+            text = await parse_resume_attachment(file.filename, await file.read())
+        except Exception as e:
+            await interaction.followup.send(f"Could not read resume file: {e}")
+            return
+    if not text.strip():
+        await interaction.followup.send("No text found in the resume. Is it a scanned image?")
+        return
+
+    get_or_create_state(session_id)
+    chunk_count = await asyncio.to_thread(save_resume, session_id, text)
+    source = f"`{file.filename}`" if file is not None else "text"
+    await interaction.followup.send(
+        f"Resume saved for this interview session ({source}, {len(text)} chars, {chunk_count} indexed sections)."
+    )
 
 @tree.command(name="end_interview", description="End the active interview session")
 async def end_interview(interaction: discord.Interaction):
@@ -815,7 +3128,7 @@ async def end_interview(interaction: discord.Interaction):
         return
 
     session_id = active[0]
-    conn = db()
+    conn = session_db(session_id)
     cur = conn.cursor()
     cur.execute("""
       UPDATE sessions
@@ -842,8 +3155,9 @@ async def export_transcript(interaction: discord.Interaction):
         session_id = last[0]
 
     tr = transcript_text(session_id)
-    tr = tr[:1800] if len(tr) > 1800 else tr
-    await interaction.response.send_message(f"Transcript (session #{session_id}):\n```{tr}```")
+    queue_reply(session_id, str(interaction.channel_id), f"```\n{tr}\n```", f"export:{interaction.id}", transcript=False)
+    OUTBOX_WAKEUP.set()
+    await interaction.response.send_message(f"Transcript (session #{session_id}):")
 
 @tree.command(name="evaluate", description="Run final rubric evaluation on current/last session")
 async def evaluate(interaction: discord.Interaction):
@@ -857,35 +3171,16 @@ async def evaluate(interaction: discord.Interaction):
             return
         session_id, candidate_id = last
 
-    await interaction.response.defer(thinking=True)
-
-    try:
-        result = run_final_evaluation(session_id, candidate_id)
-        result_text = (
-            f"**Evaluation for {candidate_id}**\n"
-            f"- Recommendation: **{result.get('recommendation', 'N/A')}**\n"
-            f"- Confidence: **{result.get('confidence', 'N/A')}**\n\n"
-            f"```json\n{json.dumps(result, indent=2, ensure_ascii=False)}\n```"
-        )
-
-        conn = db()
-        cur = conn.cursor()
-        cur.execute("""
-          INSERT INTO evaluations(session_id, result_text, result_json, created_at)
-          VALUES (?, ?, ?, ?)
-        """, (session_id, result_text, json.dumps(result, ensure_ascii=False), now_iso()))
-        conn.commit()
-        conn.close()
-
-        # Discord message limit safe split
-        if len(result_text) <= 1900:
-            await interaction.followup.send(result_text)
-        else:
-            await interaction.followup.send(result_text[:1900])
-            await interaction.followup.send(f"```json\n{json.dumps(result, indent=2, ensure_ascii=False)[:1900]}\n```")
-
-    except Exception as e:
-        await interaction.followup.send(f"Evaluation failed: {e}")
+    job_id = enqueue_job(
+        "evaluate",
+        session_id,
+        {"candidate_id": candidate_id, "channel_id": str(interaction.channel_id), "profile": ACTIVE_PROFILE},
+        f"evaluate:{interaction.id}",
+    )
+    JOB_WAKEUP.set()
+    await interaction.response.send_message(
+        f"Evaluation queued for **{candidate_id}** (job #{job_id}). Results will be posted here."
+    )
 
 # --------------------------
 # Message handler: adaptive flow
@@ -900,36 +3195,10 @@ async def on_message(message: discord.Message):
     if active:
         session_id, candidate_id, _ = active
 
-        # Save candidate message
-        candidate_msg_id = add_message(session_id, "candidate", message.content, str(message.author.id))
-
-        # If candidate asks a question, answer briefly (optionally with web search), then continue interview.
-        if candidate_asked_question(message.content):
-            answer = answer_candidate_question(message.content, session_id)
-            add_message(session_id, "interviewer", answer)
-            await message.channel.send(answer)
-
-        # Grade latest candidate answer for quality/correctness
-        try:
-            last_q = get_last_interviewer_question(session_id)
-            assessment = assess_candidate_answer(session_id, last_q, message.content)
-            save_answer_assessment(session_id, candidate_msg_id, last_q, message.content, assessment)
-        except Exception:
-            pass
-
-        # Generate next question adaptively
-        st = get_or_create_state(session_id)
-        if st["turn_count"] >= MAX_TURNS or enough_coverage(st["coverage"]):
-            done_msg = "我们已经收集到足够证据。请运行 `/end_interview`，然后 `/evaluate`。" if ACTIVE_PROFILE == "ai-tech-zh" else "Thanks — we now have enough evidence. Please run `/end_interview`, then `/evaluate`."
-            await message.channel.send(done_msg)
-        else:
-            try:
-                question = generate_next_question(session_id, message.content)
-            except Exception:
-                question = "请给出一个包含你的具体动作、指标和结果的案例。" if ACTIVE_PROFILE == "ai-tech-zh" else "Give one concrete example with your exact actions and measurable impact."
-
-            add_message(session_id, "interviewer", question)
-            await message.channel.send(question)
+        # Save candidate message and enqueue FAQ answer / grading / next question.
+        # Workers do the LLM work; replies arrive through the outbox.
+        if record_candidate_turn(session_id, message.channel.id, str(message.author.id), message.content, message.id):
+            JOB_WAKEUP.set()
 
     await bot.process_commands(message)
 
@@ -938,7 +3207,32 @@ async def on_message(message: discord.Message):
 # ============================================================
 
 if __name__ == "__main__":
-    if not DISCORD_TOKEN:
-        raise RuntimeError("Missing DISCORD_TOKEN env var")
-    init_db()
-    bot.run(DISCORD_TOKEN)
+    mark_startup("module import")
+    command = sys.argv[1] if len(sys.argv) > 1 else "bot"
+    if command in ("export", "search", "stats"):
+        # Operator tools; fan out across all shards.
+        init_db()
+        if command == "export":
+            out_path = sys.argv[2] if len(sys.argv) > 2 else "interviews_export.jsonl"
+            print(f"Exported {export_all_sessions(out_path)} session(s) to {out_path}")
+        elif command == "search":
+            for hit in search_transcripts(" ".join(sys.argv[2:])):
+                print(f"#{hit['session_id']} {hit['candidate_id']} [{hit['created_at']}] {hit['role']}: {hit['content'][:200]}")
+        else:
+            print(json.dumps(interview_stats(), indent=2, ensure_ascii=False))
+        sys.exit(0)
+    if not OPENAI_API_KEY:
+        raise RuntimeError("Missing OPENAI_API_KEY env var")
+    if command == "worker":
+        # Standalone LLM worker: `python bot.py worker` (same host, same DB_PATH)
+        IS_WORKER_PROCESS = True
+        init_db()
+        mark_startup("init_db")
+        print(startup_report())
+        asyncio.run(run_worker_process(max(1, JOB_WORKERS)))
+    else:
+        if not DISCORD_TOKEN:
+            raise RuntimeError("Missing DISCORD_TOKEN env var")
+        init_db()
+        mark_startup("init_db")
+        bot.run(DISCORD_TOKEN)
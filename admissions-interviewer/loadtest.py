@@ -0,0 +1,505 @@
+"""Concurrent interview load simulator.
+
+Drives the real `on_message` and slash-command handlers from bot.py with
+stand-in Discord channels/interactions and a local fake OpenAI Responses API
+server, then reports throughput, reply latency, event-loop lag and SQLite
+contention per concurrency level.
+
+    python loadtest.py                                  # synthetic, 1/10/100/500 sessions
+    python loadtest.py --levels 1,10 --turns 4
+    python loadtest.py --replay-db interviews.db --time-scale 0.1
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import itertools
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Tuple
+
+# ============================================================
+# Fake OpenAI server
+# ============================================================
+
+FAKE_QUESTIONS = [
+    "What exactly did you build, and how did you measure success?",
+    "Which decision on that project would you change today?",
+    "How did you handle disagreement inside your team?",
+    "Why does this program fit your next two years?",
+    "Describe a setback and what you changed afterwards.",
+    "What would your strongest reference say you should improve?",
+    "How did you verify the numbers you just mentioned?",
+]
+
+def fake_llm_output(prompt: str, rng: random.Random) -> str:
+    if "grading a candidate answer" in prompt:
+        return json.dumps({
+            "quality_score": rng.randint(2, 5),
+            "correctness": rng.choice(["correct", "partially_correct", "unclear"]),
+            "reasoning": "Simulated grade.",
+        })
+    if "adaptive interviewer" in prompt:
+        m = re.search(r"turn_count: (\d+)", prompt)
+        turn = int(m.group(1)) if m else 0
+        categories = [
+            "communication_clarity", "motivation_purpose", "self_awareness_reflection",
+            "academic_program_fit", "leadership_initiative", "integrity_professionalism",
+        ]
+        coverage = {c: {"covered": i <= turn, "evidence_count": 1 if i <= turn else 0} for i, c in enumerate(categories)}
+        return json.dumps({
+            "question": f"{rng.choice(FAKE_QUESTIONS)} ({rng.randint(1, 10**6)})",
+            "coverage_update": coverage,
+            "should_end": False,
+        })
+    if "evaluator" in prompt:
+        return json.dumps({
+            "candidate_id": "LOAD",
+            "scores": {"communication_clarity": 7},
+            "evidence": [],
+            "strengths": [],
+            "concerns": [],
+            "recommendation": "Borderline",
+            "confidence": "Low",
+        })
+    if "Candidate asked a question" in prompt:
+        return json.dumps({"answer": "Simulated answer to the candidate's question.", "reusable": True})
+    return "Simulated answer to the candidate's question."
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        prompt = body.get("input") if isinstance(body.get("input"), str) else json.dumps(body.get("input"))
+        srv = self.server
+        previous_id = body.get("previous_response_id")
+        context_tokens, chain_started = 0, time.time()
+        with srv.lock:
+            if previous_id:
+                stored = srv.responses.get(previous_id)
+                if stored is None or (srv.handle_ttl and time.time() - stored[1] > srv.handle_ttl):
+                    self.send_json(400, {"error": {
+                        "message": f"Previous response with id '{previous_id}' not found.",
+                        "type": "invalid_request_error",
+                        "param": "previous_response_id",
+                        "code": "previous_response_not_found",
+                    }})
+                    return
+                context_tokens, chain_started = stored
+            delay = srv.rng.lognormvariate(math.log(srv.median), srv.sigma)
+            text = fake_llm_output(prompt or "", srv.rng)
+        if "evaluator" in (prompt or ""):
+            delay *= srv.eval_factor
+        time.sleep(delay)
+
+        # a chained call is billed for the stored context too (served from the prompt cache)
+        input_tokens = context_tokens + len(prompt or "") // 4
+        output_tokens = len(text) // 4
+        response_id = f"resp_{next(srv.ids)}"
+        with srv.lock:
+            srv.responses[response_id] = (input_tokens + output_tokens, chain_started)
+        if "adaptive interviewer" in (prompt or ""):
+            with STATS.lock:
+                STATS.question_calls.append((len(prompt), input_tokens))
+        payload = {
+            "id": response_id,
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": "completed",
+            "model": body.get("model", "fake"),
+            "output": [{
+                "type": "message",
+                "id": f"msg_{next(srv.ids)}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": context_tokens},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + output_tokens,
+            },
+        }
+        self.send_json(200, payload)
+
+    def send_json(self, status: int, payload: Dict[str, Any]):
+        raw = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_openai(median: float, sigma: float, eval_factor: float, seed: int, handle_ttl: float = 0.0) -> ThreadingHTTPServer:
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    srv.daemon_threads = True
+    srv.median, srv.sigma, srv.eval_factor = median, sigma, eval_factor
+    srv.handle_ttl = handle_ttl  # seconds a stored response chain can be continued; 0 = forever
+    srv.responses = {}  # response id -> (context tokens, chain start time)
+    srv.rng = random.Random(seed)
+    srv.lock = threading.Lock()
+    srv.ids = itertools.count(1)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+# ============================================================
+# Stand-in Discord objects
+# ============================================================
+
+class FakeAuthor:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.bot = False
+        self.mention = f"<@{user_id}>"
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.sent = []  # (perf_counter, reply)
+        self.changed = asyncio.Event()
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        # the sender merges replies queued together with a blank line; count them separately
+        now = time.perf_counter()
+        self.sent.extend((now, part) for part in (content or "").split("\n\n"))
+        self.changed.set()
+
+    async def wait_for_count(self, count: int, timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        while len(self.sent) < count:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+class FakeMessage:
+    ids = itertools.count(10**12)
+
+    def __init__(self, channel: FakeChannel, author: FakeAuthor, content: str):
+        self.id = next(FakeMessage.ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send_message(self, content: Optional[str] = None, **kwargs):
+        self.interaction.replies.append(content or "")
+
+    async def defer(self, **kwargs):
+        pass
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        self.interaction.replies.append(content or "")
+
+class FakeInteraction:
+    ids = itertools.count(10**13)
+
+    def __init__(self, channel: FakeChannel, guild_id: int = 0):
+        self.id = next(FakeInteraction.ids)
+        self.channel = channel  # not a discord.TextChannel, so no thread is created
+        self.channel_id = channel.id
+        self.guild_id = guild_id
+        self.replies = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+# ============================================================
+# Instrumentation
+# ============================================================
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reply_latencies = []
+        self.handler_times = []
+        self.eval_latencies = []
+        self.loop_lag = []
+        self.db_writes = []
+        self.db_reads = []
+        self.db_locked = 0
+        self.question_calls = []  # (prompt chars sent, billed input tokens) per next-question call
+        self.turns = 0
+        self.sessions_done = 0
+        self.timeouts = 0
+
+STATS = Stats()
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e):
+                with STATS.lock:
+                    STATS.db_locked += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            is_write = sql.lstrip().split(None, 1)[0].upper() in {"INSERT", "UPDATE", "DELETE", "BEGIN"}
+            with STATS.lock:
+                (STATS.db_writes if is_write else STATS.db_reads).append(elapsed)
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            with STATS.lock:
+                STATS.db_writes.append(time.perf_counter() - t0)
+
+async def monitor_loop_lag(interval: float = 0.05):
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        STATS.loop_lag.append(max(0.0, time.perf_counter() - t0 - interval))
+
+def pct(values: List[float], q: float) -> float:
+    vals = sorted(values)
+    if not vals:
+        return 0.0
+    return vals[min(len(vals) - 1, max(0, int(math.ceil(q * len(vals))) - 1))]
+
+# ============================================================
+# Scripts (recorded or synthetic candidates)
+# ============================================================
+
+SYNTHETIC_ANSWERS = [
+    "I led a robotics club of twelve students and we rebuilt our drivetrain after losing two regionals.",
+    "Honestly I chose this program because of the undergraduate research track and the lab on applied ML.",
+    "My biggest failure was missing a deadline on a group project; I now plan in weekly milestones.",
+    "I tutored younger students in math every weekend for two years and tracked their grades.",
+    "At my internship I built a small data pipeline in Python that cut report time from days to hours.",
+    "When a teammate copied code from another team I raised it with our advisor before submitting.",
+    "What is the deadline for the scholarship application?",
+    "Can I ask how large the first-year cohort usually is?",
+]
+
+def synthetic_script(rng: random.Random, turns: int, think_median: float, think_sigma: float) -> List[Tuple[float, str]]:
+    return [(rng.lognormvariate(math.log(think_median), think_sigma), rng.choice(SYNTHETIC_ANSWERS)) for _ in range(turns)]
+
+def _parse_ts(value: str) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except Exception:
+        return None
+
+def load_recorded_scripts(path: str, time_scale: float, max_think: float) -> List[List[Tuple[float, str]]]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM sessions ORDER BY id ASC")
+    session_ids = [r[0] for r in cur.fetchall()]
+    scripts = []
+    for sid in session_ids:
+        cur.execute("SELECT role, content, created_at FROM messages WHERE session_id=? ORDER BY id ASC", (sid,))
+        script, last_ts = [], None
+        for role, content, created_at in cur.fetchall():
+            ts = _parse_ts(created_at)
+            if role == "candidate" and content.strip():
+                think = (ts - last_ts) if (ts is not None and last_ts is not None) else 1.0
+                script.append((min(max_think, max(0.0, think)) * time_scale, content))
+            last_ts = ts
+        if script:
+            scripts.append(script)
+    conn.close()
+    return scripts
+
+# ============================================================
+# Simulation
+# ============================================================
+
+async def run_session(botmod, channels: Dict[int, FakeChannel], idx: int, script: List[Tuple[float, str]], reply_timeout: float, evaluate: bool, guilds: int):
+    channel = FakeChannel(9_000_000 + idx)
+    channels[channel.id] = channel
+    author = FakeAuthor(5_000_000 + idx)
+    guild_id = 1_000 + idx % max(1, guilds)
+
+    await botmod.start_interview.callback(FakeInteraction(channel, guild_id), candidate_id=f"LOAD{idx:04d}")
+    for think, text in script:
+        await asyncio.sleep(think)
+        expected = 2 if botmod.candidate_asked_question(text) else 1
+        before = len(channel.sent)
+        t0 = time.perf_counter()
+        await botmod.on_message(FakeMessage(channel, author, text))
+        STATS.handler_times.append(time.perf_counter() - t0)
+        if not await channel.wait_for_count(before + expected, reply_timeout):
+            STATS.timeouts += 1
+            return
+        STATS.reply_latencies.append(channel.sent[before + expected - 1][0] - t0)
+        STATS.turns += 1
+        if "/end_interview" in channel.sent[-1][1]:
+            break
+
+    await botmod.end_interview.callback(FakeInteraction(channel, guild_id))
+    if evaluate:
+        before = len(channel.sent)
+        t0 = time.perf_counter()
+        await botmod.evaluate.callback(FakeInteraction(channel, guild_id))
+        if await channel.wait_for_count(before + 1, reply_timeout * 4):
+            STATS.eval_latencies.append(channel.sent[before][0] - t0)
+        else:
+            STATS.timeouts += 1
+    STATS.sessions_done += 1
+
+async def run_level(botmod, channels, level: int, scripts: List[List[Tuple[float, str]]], args, workdir: str) -> Dict[str, Any]:
+    botmod.DB_PATH = os.path.join(workdir, f"load_{level}.db")
+    botmod.SHARD_DIR = os.path.join(workdir, f"shards_{level}")
+    botmod.init_db()
+    global STATS
+    STATS = Stats()
+    lag_task = asyncio.create_task(monitor_loop_lag())
+    t0 = time.perf_counter()
+    await asyncio.gather(*[
+        run_session(botmod, channels, i, scripts[i % len(scripts)], args.reply_timeout, args.evaluate, args.guilds)
+        for i in range(level)
+    ])
+    wall = time.perf_counter() - t0
+    lag_task.cancel()
+    return {
+        "sessions": level,
+        "done": STATS.sessions_done,
+        "turns": STATS.turns,
+        "timeouts": STATS.timeouts,
+        "wall_s": wall,
+        "turns_per_s": STATS.turns / wall if wall else 0.0,
+        "reply_p50": pct(STATS.reply_latencies, 0.50),
+        "reply_p95": pct(STATS.reply_latencies, 0.95),
+        "reply_p99": pct(STATS.reply_latencies, 0.99),
+        "handler_p99_ms": pct(STATS.handler_times, 0.99) * 1000,
+        "eval_p95": pct(STATS.eval_latencies, 0.95),
+        "lag_p99_ms": pct(STATS.loop_lag, 0.99) * 1000,
+        "lag_max_ms": max(STATS.loop_lag or [0.0]) * 1000,
+        "db_write_p99_ms": pct(STATS.db_writes, 0.99) * 1000,
+        "db_write_max_ms": max(STATS.db_writes or [0.0]) * 1000,
+        "db_locked": STATS.db_locked,
+        "q_sent_kb": sum(c for c, _ in STATS.question_calls) / len(STATS.question_calls) / 1024 if STATS.question_calls else 0.0,
+        "q_in_tok": sum(t for _, t in STATS.question_calls) / len(STATS.question_calls) if STATS.question_calls else 0.0,
+    }
+
+def print_report(results: List[Dict[str, Any]]):
+    cols = [
+        "sessions", "done", "turns", "timeouts", "turns_per_s", "reply_p50", "reply_p95", "reply_p99",
+        "handler_p99_ms", "eval_p95", "lag_p99_ms", "lag_max_ms", "db_write_p99_ms", "db_write_max_ms", "db_locked",
+        "q_sent_kb", "q_in_tok",
+    ]
+    print("  ".join(c for c in cols))
+    for r in results:
+        cells = []
+        for c in cols:
+            v = r[c]
+            cells.append(f"{v:>{len(c)}.2f}" if isinstance(v, float) else f"{v:>{len(c)}}")
+        print("  ".join(cells))
+    print("(latencies in seconds unless marked _ms; q_sent_kb / q_in_tok: mean prompt sent / input tokens billed per next-question call)")
+
+async def main_async(args, scripts):
+    workdir = tempfile.mkdtemp(prefix="interview-load-")
+    os.environ["DB_PATH"] = os.path.join(workdir, "bootstrap.db")
+    import bot as botmod
+
+    botmod.JOB_WORKERS = args.workers
+    botmod.STATEFUL_QUESTIONS = args.stateful
+    botmod.SHARD_MODE = args.shard_mode
+    botmod.SHARDED = args.shard_mode in ("guild", "hash")
+    channels: Dict[int, FakeChannel] = {}
+
+    async def _ready():
+        return None
+
+    async def _no_commands(message):
+        return None
+
+    # Route the bot's Discord surface to the stand-ins
+    botmod.bot.get_channel = channels.get
+    botmod.bot.wait_until_ready = _ready
+    botmod.bot.process_commands = _no_commands
+    botmod.db = lambda path=None: sqlite3.connect(path or botmod.DB_PATH, timeout=30, factory=TimedConnection)
+
+    tasks = [asyncio.create_task(botmod.job_worker_loop(f"load:w{i}")) for i in range(args.workers)]
+    tasks.append(asyncio.create_task(botmod.outbox_delivery_loop()))
+
+    results = []
+    for level in args.levels:
+        print(f"Running {level} concurrent session(s)...", flush=True)
+        results.append(await run_level(botmod, channels, level, scripts, args, workdir))
+    for t in tasks:
+        t.cancel()
+    print()
+    print_report(results)
+    print(f"Databases kept in {workdir}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Concurrent interview load simulator")
+    ap.add_argument("--levels", default="1,10,100,500", help="comma-separated concurrent session counts")
+    ap.add_argument("--turns", type=int, default=6, help="candidate turns per synthetic session")
+    ap.add_argument("--replay-db", help="replay candidate messages from an existing interviews.db")
+    ap.add_argument("--time-scale", type=float, default=1.0, help="multiplier for recorded think times")
+    ap.add_argument("--max-think", type=float, default=120.0, help="cap for a recorded think time (seconds)")
+    ap.add_argument("--think-median", type=float, default=3.0, help="synthetic think time median (seconds)")
+    ap.add_argument("--think-sigma", type=float, default=0.6, help="synthetic think time lognormal sigma")
+    ap.add_argument("--llm-median", type=float, default=0.8, help="fake LLM latency median (seconds)")
+    ap.add_argument("--llm-sigma", type=float, default=0.5, help="fake LLM latency lognormal sigma")
+    ap.add_argument("--eval-factor", type=float, default=4.0, help="evaluation latency multiplier")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("JOB_WORKERS", "2")), help="in-process job workers")
+    ap.add_argument("--reply-timeout", type=float, default=120.0, help="seconds to wait for a reply")
+    ap.add_argument("--evaluate", action="store_true", help="run /evaluate at the end of each session")
+    ap.add_argument("--guilds", type=int, default=1, help="spread sessions across this many fake guilds")
+    ap.add_argument("--shard-mode", default=os.getenv("SHARD_MODE", "none"), choices=["none", "guild", "hash"])
+    ap.add_argument("--stateful", action="store_true", help="chain next-question calls with previous_response_id")
+    ap.add_argument("--handle-ttl", type=float, default=0.0, help="fake server forgets response chains older than this (seconds; 0 = never)")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    args.levels = [int(x) for x in args.levels.split(",") if x.strip()]
+
+    rng = random.Random(args.seed)
+    if args.replay_db:
+        scripts = load_recorded_scripts(args.replay_db, args.time_scale, args.max_think)
+        if not scripts:
+            sys.exit(f"No candidate messages found in {args.replay_db}")
+        print(f"Replaying {len(scripts)} recorded transcript(s) from {args.replay_db}")
+    else:
+        scripts = [synthetic_script(rng, args.turns, args.think_median, args.think_sigma) for _ in range(max(args.levels))]
+
+    srv = start_fake_openai(args.llm_median, args.llm_sigma, args.eval_factor, args.seed, args.handle_ttl)
+    os.environ["OPENAI_API_KEY"] = "sk-load-test"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ.pop("BRAVE_API_KEY", None)
+    try:
+        asyncio.run(main_async(args, scripts))
+    finally:
+        srv.shutdown()
+
+if __name__ == "__main__":
+    main()
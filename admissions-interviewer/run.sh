@@ -18,7 +18,7 @@ if [ ! -d ".venv" ]; then
 fi
 
 source .venv/bin/activate
-pip install -U discord.py openai requests >/dev/null
+pip install -U discord.py openai requests pypdf >/dev/null
 
 set -a
 source .env